@@ -11,6 +11,8 @@ SUMMARY
     This python script is called by gui_titanic.py and runs embedded in it
     It's main function is to run a map-only Hadoop streaming job in the
     Python language on Amazon Web Service's Elastic MapReduce
+    The map output parts are merged and sorted locally by merge_output.py,
+    --total-order sorts them on EMR instead with a single reducer
     It can also run on the command line with default values
 
 REQUIREMENTS
@@ -31,11 +33,66 @@ REQUIREMENTS
 import sys
 import os
 import glob
-from time import sleep
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
 from uuid import getnode as get_mac
 import boto
 from boto.emr import connect_to_region
+from boto.emr.bootstrap_action import BootstrapAction
 from boto.emr.step import StreamingStep
+from boto.utils import parse_ts
+
+# The model registry lives with the mapper so it can be shipped to hadoop
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'mapper'))
+import survival_model # pylint: disable=F0401,C0413
+from local_titanic import LocalProcessing, LOCAL_THRESHOLD
+import merge_output
+from s3_transfer import S3Transfer, UploadManifest, THREADS
+from job_watcher import JobWatcher, BackoffPolicy, JobTimeout
+import shard_input
+
+# Code files the mapper needs, uploaded under mapper/
+MAPPER_FILES = ['mapper.py', 'passenger_csv.py', 'survival_model.py',
+                'reducer.py', 'passenger_columns.py']
+
+# Job settings sorting "PassengerId,prediction" text lines by number
+TOTAL_ORDER_TEXT_ARGS = [
+    '-D', 'stream.map.output.field.separator=,',
+    '-D', 'mapred.output.key.comparator.class='
+          'org.apache.hadoop.mapred.lib.KeyFieldBasedComparator',
+    '-D', 'mapred.text.key.comparator.options=-k1,1n',
+    '-D', 'mapred.textoutputformat.separator=,']
+
+# Labelled Kaggle data used by --score, not kept in the repository
+TRAIN_FILE = '../data/train.csv'
+
+# ETags of files already in S3, unchanged files aren't uploaded again
+UPLOAD_MANIFEST = '../.s3_manifest.json'
+
+# Typical seconds the job spends RUNNING, polling speeds up towards it
+EXPECTED_RUNNING = 120
+
+# Ids of the warm job flows kept alive between runs, one per region
+WARM_JOBFLOW_FILE = '../.emr_jobflow.json'
+
+# A warm job flow unused for this many seconds shuts itself down
+IDLE_TIMEOUT = 60 * 60
+
+# Bootstrap action of the warm job flow doing that, uploaded under bootstrap/
+IDLE_SHUTDOWN_SCRIPT = 'idle_shutdown.sh'
+
+# A warm job flow this close to its idle shutdown isn't given a new step
+IDLE_MARGIN = 5 * 60
+
+# Job flow states that can still accept steps
+ALIVE_STATES = ('STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING')
+
+# EMR logs older than this are removed when the bucket is emptied
+LOG_MAX_AGE = timedelta(days=7)
 
 
 class EmrProcessing(object):
@@ -51,13 +108,60 @@ class EmrProcessing(object):
         self.region_name = None
         self.verbose_mode = None
         self.model_choice = None
+        self.model_choices = []
+        self.typedbytes = False
+        self.score_mode = False
+        self.total_order = False
+        self.shards = None
+        self.compression = None
+        self.local_mode = False
+        self.warm_cluster = False
+        self.step_id = None
+        # S3 transfers running at once
+        self.transfer_threads = THREADS
 
     def parse_user_selections(self):
         """ Applies command line arguments (or defaults) to program logic"""
-        if "model2" in sys.argv:
-            self.model_choice = "model2"
+        model_names = survival_model.load_registry().keys()
+        # several models, or all of them with --sweep, share one pass
+        if "--sweep" in sys.argv:
+            self.model_choices = model_names
         else:
-            self.model_choice = "model1"
+            self.model_choices = [arg for arg in sys.argv[1:]
+                                  if arg in model_names] or model_names[:1]
+        self.model_choice = self.model_choices[0]
+
+        # binary map output, saves the reduce stage from parsing text
+        self.typedbytes = "--typedbytes" in sys.argv
+
+        # accuracy against the labelled train.csv instead of predictions
+        self.score_mode = "--score" in sys.argv
+        if self.score_mode and not os.path.exists(TRAIN_FILE):
+            print "%s not found, --score needs the labelled train.csv from " \
+                "Kaggle's Titanic competition there" % \
+                os.path.normpath(TRAIN_FILE)
+            sys.exit(1)
+
+        # sort by PassengerId on EMR, otherwise there's no reduce stage
+        self.total_order = "--total-order" in sys.argv
+
+        # compressed shards give EMR a mapper per shard and upload less
+        if "--shards" in sys.argv:
+            self.shards = int(sys.argv[sys.argv.index("--shards") + 1])
+        if "--compress" in sys.argv:
+            compression = (sys.argv[sys.argv.index("--compress") + 1:] or
+                           [""])[0]
+            if compression == "none":
+                compression = None
+            if compression not in shard_input.COMPRESSIONS:
+                print "--compress takes one of %s, not %r" % (", ".join(
+                    sorted(name or "none"
+                           for name in shard_input.COMPRESSIONS)),
+                    compression)
+                sys.exit(1)
+            self.compression = compression
+        elif self.shards:
+            self.compression = 'gz'
 
         if "Virginia" in sys.argv:
             self.region = "Virginia"
@@ -69,9 +173,34 @@ class EmrProcessing(object):
             self.region = "Oregon"
             self.region_name = 'us-west-2'
 
+        # keep the cluster up between runs, skipping the bootstrap time
+        self.warm_cluster = "--warm" in sys.argv
+
+        # small inputs are quicker to score here than to start EMR for
+        if "--local" in sys.argv:
+            self.local_mode = True
+        elif "--emr" in sys.argv:
+            self.local_mode = False
+        else:
+            self.local_mode = \
+                os.path.getsize(self.input_file()) < LOCAL_THRESHOLD
+
         if self.verbose_mode:
-            print "** will run the Machine Learning %s" % self.model_choice
-            print "\n** Running on %s Elastic Map Reduce server" % self.region
+            print "** will run the Machine Learning %s" % \
+                ", ".join(self.model_choices)
+            if self.local_mode:
+                print "\n** Running locally on all cores, no EMR needed"
+            else:
+                print "\n** Running on %s Elastic Map Reduce server" % \
+                    self.region
+
+    def input_file(self):
+        """ Local path of the data the job reads"""
+        return TRAIN_FILE if self.score_mode else '../data/test.csv'
+
+    def input_prefix(self):
+        """ S3 folder of the job input, the two inputs are kept apart"""
+        return 'train/' if self.score_mode else 'input/'
 
     @staticmethod
     def clear_local_output_directory():
@@ -96,106 +225,300 @@ class EmrProcessing(object):
         return 'titanic-' + str(get_mac())
 
     def empty_bucket(self):
-        """ Clears and files from the S3 bucket"""
+        """ Clears old output and stale logs from the S3 bucket
+
+        Inputs, mapper and model are kept for create_and_fill_bucket to
+        reuse when they haven't changed
+        """
         self.s3_handle = boto.connect_s3()
         EmrProcessing.bucket_name = self.generate_unique_name()
         EmrProcessing.bucket = \
             self.s3_handle.create_bucket(EmrProcessing.bucket_name)
-        EmrProcessing.bucket.delete_keys([key.name \
-            for key in EmrProcessing.bucket])
+        stale_keys = [key.name for key in EmrProcessing.bucket.list('output/')]
+        oldest_log = datetime.utcnow() - LOG_MAX_AGE
+        stale_keys.extend([key.name for key in
+            EmrProcessing.bucket.list('jobflow_logs/')
+            if parse_ts(key.last_modified) < oldest_log])
+        if stale_keys:
+            EmrProcessing.bucket.delete_keys(stale_keys)
 
     def create_and_fill_bucket(self):
-        """ Creates bucket if needed and transfers mapper file"""
+        """ Creates bucket if needed and transfers input, mapper and model
+
+        With shards or compression selected the input is uploaded as
+        compressed shards, input left from other shardings is removed
+        """
         EmrProcessing.bucket = \
             self.s3_handle.create_bucket(EmrProcessing.bucket_name)
-        key = EmrProcessing.bucket.new_key('input/test.csv')
-        input_file_path = '../data/test.csv'
-        key.set_contents_from_filename(input_file_path)
-        key.set_acl('public-read')
-
-        key = EmrProcessing.bucket.new_key('mapper/mapper.py')
-        input_file_path = '../src/mapper/mapper.py'
-        key.set_contents_from_filename(input_file_path)
-        key.set_acl('public-read')
+        shard_dir = None
+        input_files = [self.input_file()]
+        if self.shards or self.compression:
+            shard_dir = tempfile.mkdtemp(prefix='titanic-shards-')
+            shard_size = shard_input.SHARD_SIZE
+            if self.shards:
+                shard_size = shard_input.shard_size_for(input_files[0],
+                                                        self.shards)
+            input_files = shard_input.write_shards(input_files[0], shard_dir,
+                                                   shard_size,
+                                                   self.compression)
+        uploads = [(input_file,
+                    self.input_prefix() + os.path.basename(input_file))
+                   for input_file in input_files]
+        stale_keys = [key.name for key in
+                      EmrProcessing.bucket.list(self.input_prefix())
+                      if key.name not in [upload[1] for upload in uploads]]
+        if stale_keys:
+            EmrProcessing.bucket.delete_keys(stale_keys)
+        for mapper_file in MAPPER_FILES:
+            uploads.append(('../src/mapper/' + mapper_file,
+                            'mapper/' + mapper_file))
+        # the only upload that changes when switching models
+        uploads.append(('../src/mapper/model.json', 'model/model.json'))
+        if self.warm_cluster:
+            uploads.append(('../src/' + IDLE_SHUTDOWN_SCRIPT,
+                            'bootstrap/' + IDLE_SHUTDOWN_SCRIPT))
+        transfer = S3Transfer(EmrProcessing.bucket,
+                              threads=self.transfer_threads,
+                              manifest=UploadManifest(UPLOAD_MANIFEST))
+        try:
+            transfer.upload_files(uploads, policy='public-read')
+        finally:
+            if shard_dir is not None:
+                shutil.rmtree(shard_dir)
+        if self.verbose_mode:
+            for _, key_name in transfer.skipped:
+                print "** %s unchanged, not uploaded" % key_name
 
     def setup_and_run_job(self):
-        """ Runs the Elastic MapReduce job on AWS"""
-        step = StreamingStep(name='Titanic Machine Learning',
+        """ Runs the Elastic MapReduce job on AWS
+
+        In warm cluster mode the job is a step added to the job flow kept
+        alive by an earlier run, which is started if there's none.  A new
+        warm job flow shuts itself down after IDLE_TIMEOUT without a job
+        """
+        step = self.streaming_step()
+        if self.conn is None:
+            self.conn = connect_to_region(self.region_name)
+        if not self.warm_cluster:
+            self.jobid = self.conn.run_jobflow(name='Titanic Devp',
+                log_uri='s3://' + EmrProcessing.bucket_name +
+                    '/jobflow_logs', steps=[step])
+            return
+
+        self.jobid = self.find_warm_jobflow()
+        if self.jobid is None:
+            idle_shutdown = BootstrapAction('Idle shutdown',
+                's3://' + EmrProcessing.bucket_name + '/bootstrap/' +
+                IDLE_SHUTDOWN_SCRIPT, [str(IDLE_TIMEOUT)])
+            self.jobid = self.conn.run_jobflow(name='Titanic Warm',
+                log_uri='s3://' + EmrProcessing.bucket_name +
+                    '/jobflow_logs', keep_alive=True, steps=[],
+                bootstrap_actions=[idle_shutdown])
+            if self.verbose_mode:
+                print "** Started warm job flow %s" % self.jobid
+        elif self.verbose_mode:
+            print "** Reusing warm job flow %s" % self.jobid
+        self.step_id = \
+            self.conn.add_jobflow_steps(self.jobid, [step]).stepids[0].value
+        self.save_warm_jobflow()
+
+    def streaming_step(self):
+        """ The hadoop streaming step of the selected mode
+
+        Predictions are map only, the unsorted parts are merged locally.
+        With total_order one reducer sorts them numerically by PassengerId,
+        so the merge finds a single sorted part.  Scoring runs sum their
+        counts with reducer.py, which also runs as the combiner so each
+        mapper node sends one line per model
+        """
+        step_args = []
+        reducer = None
+        combiner = None
+        if self.score_mode:
+            step_args += ['-D', 'titanic.mode=score']
+            reducer = combiner = 's3n://' + EmrProcessing.bucket_name + \
+                '/mapper/reducer.py'
+        else:
+            if self.typedbytes:
+                step_args += ['-D', 'stream.map.output=typedbytes']
+            if self.total_order:
+                reducer = 'org.apache.hadoop.mapred.lib.IdentityReducer'
+                step_args += ['-D', 'mapred.reduce.tasks=1']
+                if not self.typedbytes:
+                    # typed bytes ints already sort by value, text keys
+                    #   are split at the comma and compared as numbers
+                    step_args += TOTAL_ORDER_TEXT_ARGS
+        return StreamingStep(name='Titanic Machine Learning',
             mapper='s3n://'  + EmrProcessing.bucket_name + '/mapper/mapper.py',
-            reducer='org.apache.hadoop.mapred.lib.IdentityReducer',
-            input='s3n://'  + EmrProcessing.bucket_name + '/input/',
-            output='s3n://' + EmrProcessing.bucket_name + '/output/')
-        self.conn = connect_to_region(self.region_name)
-        self.jobid = self.conn.run_jobflow(name='Titanic Devp',
-            log_uri='s3://' + EmrProcessing.bucket_name +
-                '/jobflow_logs', steps=[step])
-
-    def wait_until_job_completes(self):
-        """ Provides EMR status updates at 10 second intervals """
-        while True:
-            jobflow = self.conn.describe_jobflow(self.jobid)
+            reducer=reducer,
+            combiner=combiner,
+            input='s3n://'  + EmrProcessing.bucket_name + '/' +
+                self.input_prefix(),
+            output='s3n://' + EmrProcessing.bucket_name + '/output/',
+            # modules imported by the mapper and the model side file
+            cache_files=['s3n://' + EmrProcessing.bucket_name +
+                '/mapper/passenger_csv.py#passenger_csv.py',
+                's3n://' + EmrProcessing.bucket_name +
+                '/mapper/survival_model.py#survival_model.py',
+                's3n://' + EmrProcessing.bucket_name +
+                '/mapper/reducer.py#reducer.py',
+                's3n://' + EmrProcessing.bucket_name +
+                '/mapper/passenger_columns.py#passenger_columns.py',
+                's3n://' + EmrProcessing.bucket_name +
+                '/model/model.json#model.json'],
+            step_args=step_args or None)
+
+    @staticmethod
+    def load_warm_jobflows():
+        """ {region name: {'jobflow_id', 'last_used'}} of the saved warm
+        job flows"""
+        if not os.path.exists(WARM_JOBFLOW_FILE):
+            return {}
+        with open(WARM_JOBFLOW_FILE, 'r') as jobflow_file:
+            return json.load(jobflow_file)
+
+    @staticmethod
+    def store_warm_jobflows(jobflows):
+        """ Saves the warm job flows, the file goes when there are none"""
+        if not jobflows:
+            if os.path.exists(WARM_JOBFLOW_FILE):
+                os.remove(WARM_JOBFLOW_FILE)
+            return
+        with open(WARM_JOBFLOW_FILE, 'w') as jobflow_file:
+            json.dump(jobflows, jobflow_file)
+
+    def find_warm_jobflow(self):
+        """ Id of the region's saved warm job flow if it can still take
+        steps
+
+        One about to shut itself down as idle is terminated instead, the
+        step could be added just before the shutdown
+        """
+        jobflows = self.load_warm_jobflows()
+        saved = jobflows.get(self.region_name)
+        if saved is None:
+            return None
+        if time.time() - saved['last_used'] > IDLE_TIMEOUT - IDLE_MARGIN:
+            self.conn.terminate_jobflow(saved['jobflow_id'])
+            del jobflows[self.region_name]
+            self.store_warm_jobflows(jobflows)
+            return None
+        if self.conn.describe_jobflow(saved['jobflow_id']).state \
+                not in ALIVE_STATES:
+            del jobflows[self.region_name]
+            self.store_warm_jobflows(jobflows)
+            return None
+        return saved['jobflow_id']
+
+    def save_warm_jobflow(self):
+        """ Remembers the region's warm job flow and when it was last
+        used, those of other regions are kept"""
+        jobflows = self.load_warm_jobflows()
+        jobflows[self.region_name] = {'jobflow_id': self.jobid,
+                                      'last_used': time.time()}
+        self.store_warm_jobflows(jobflows)
+
+    def terminate_warm_jobflow(self, region_name=None):
+        """ Shuts down the saved warm job flow of a region, or those of
+        every region"""
+        jobflows = self.load_warm_jobflows()
+        for saved_region in jobflows.keys():
+            if region_name not in (None, saved_region):
+                continue
+            conn = self.conn
+            if conn is None or saved_region != self.region_name:
+                conn = connect_to_region(saved_region)
+            jobflow_id = jobflows.pop(saved_region)['jobflow_id']
+            conn.terminate_jobflow(jobflow_id)
             if self.verbose_mode:
-                print jobflow.state
-            if (jobflow.state == 'COMPLETED' or jobflow.state == 'TERMINATED'
-                or jobflow.state == 'FAILED'):
-                break
-            sleep(10)
+                print "** Terminated warm job flow %s in %s" % (jobflow_id,
+                                                                saved_region)
+        self.store_warm_jobflows(jobflows)
+
+    def wait_until_job_completes(self, **watch_options):
+        """ Provides EMR status updates as the job flow changes state
+
+        A warm cluster never completes, so there the step is watched and a
+        hung step terminates the whole job flow.  Returns the final state
+        and the StateTiming of every state passed through.  A job still not
+        done at the timeout is terminated and the program exits after
+        showing the timings.  watch_options go to the JobWatcher (timeout,
+        clock, sleep)
+        """
+        if self.step_id is None:
+            describe = lambda: self.conn.describe_jobflow(self.jobid).state
+            terminate = lambda: self.conn.terminate_jobflow(self.jobid)
+        else:
+            describe = lambda: self.conn.describe_step(
+                self.jobid, self.step_id).status.state
+            terminate = lambda: self.terminate_warm_jobflow(self.region_name)
+        watcher = JobWatcher(describe, terminate=terminate,
+            policy=BackoffPolicy(expected_running=EXPECTED_RUNNING),
+            **watch_options)
+        if self.verbose_mode:
+            watcher.add_listener(self.print_state_timing)
+        try:
+            state = watcher.watch()
+        except JobTimeout as timeout:
+            print "\n** EMR job %s, it was terminated" % timeout
+            # verbose mode has shown them as they happened
+            if not self.verbose_mode:
+                for timing in watcher.timings:
+                    self.print_state_timing(timing)
+            sys.exit(1)
+        if self.step_id is not None:
+            # the idle timeout counts from the end of the last step
+            self.save_warm_jobflow()
+        return state, watcher.timings
+
+    @staticmethod
+    def print_state_timing(timing):
+        """ Shows each new job flow state and how long the last one took"""
+        print "%s  (%s took %d seconds)" % (timing.next_state or "TIMED OUT",
+                                            timing.state, timing.duration)
 
     def download_output_files(self):
         """ Create local copy of EMR results"""
-        bucket_list = self.bucket.list("output/part")
-        for bucket_entry in bucket_list:
-            key_string = str(bucket_entry.key)
+        downloads = []
+        for bucket_entry in self.bucket.list("output/part"):
+            local_path = "../" + str(bucket_entry.key)
             # check if file exists locally, if not: download it
-            if not os.path.exists(key_string):
-                bucket_entry.get_contents_to_filename("../" + key_string)
+            if not os.path.exists(local_path):
+                downloads.append((bucket_entry, local_path))
             else:
                 print "output file already exists, please delete"
+        S3Transfer(self.bucket,
+                   threads=self.transfer_threads).download_keys(downloads)
 
     @staticmethod
-    def update_mapper_file(model_name):
-        """ Alters one array in mapper file to the selected model"""
-        # only update female array, males always die :(
-        with open('../src/mapper/mapper.py', 'w') as output_file:
-            with open('../src/mapper/mapper_template.py', 'r') as input_file:
-                for line in input_file:
-                    if "female_survival_table =" in line:
-                        insert_string = "    female_survival_table = "
-                        if model_name == "model2":
-                            insert_string += ("[[0, 0, 1, 1]," +
-                                " [0, 1, 1, 1], [1, 1, 0, 0]]\n")
-                        else:
-                            insert_string += ("[[1, 1, 1, 1]," +
-                                " [1, 1, 1, 1], [1, 1, 1, 1]]\n")
-                        output_file.write(insert_string)
-                    else:
-                        output_file.write(line)
+    def write_model_file(*model_names):
+        """ Writes the selected registry models to the mapper side file"""
+        registry = survival_model.load_registry()
+        survival_model.write_models([registry[model_name]
+                                     for model_name in model_names],
+                                    '../src/mapper/model.json')
+
+    @staticmethod
+    def post_process_output_file(max_records=merge_output.MAX_RECORDS,
+                                 model_names=None):
+        """ Cleans up EMR output into Kaggle csv format
+
+        Every part file is merged, at most max_records are sorted in memory.
+        A sweep of several model_names is also split into one csv per model
+        """
+        part_files = sorted(glob.glob('../output/part-*'))
+        merge_output.merge_part_files(part_files,
+            '../output/titanic_test_data.csv', max_records, model_names)
+        if model_names and len(model_names) > 1:
+            merge_output.split_models('../output/titanic_test_data.csv',
+                model_names, '../output/titanic_test_data_%s.csv')
+
 
     @staticmethod
-    def post_process_output_file():
-        """ Cleans up EMR output into Kaggle csv format"""
-        parsed_data = []
-        unparseable_data = []
-
-        with open('../output/part-00000', 'r') as input_file:
-            for line in input_file:
-                line = line.strip()
-                try:
-                    csv_splits = line.split(',')
-                    csv_splits[0] = int(csv_splits[0])
-                    # parsed_data is a list of lists
-                    parsed_data.append(csv_splits)
-                except ValueError:
-                    unparseable_data.append(line)
-        parsed_data.sort()
-
-        with open('../output/titanic_test_data.csv', 'w') as output_file:
-            # start with lines that couldn't be parsed
-            # hopefully this will only be the original header
-            for line in unparseable_data:
-                output_file.write("%s\n" % line)
-            for line in parsed_data:
-                output_file.write("%d,%s\n" % (line[0], line[1]))
+    def post_process_scores():
+        """ Turns the confusion counts of a scoring run into accuracies"""
+        part_files = sorted(glob.glob('../output/part-*'))
+        merge_output.write_scores(part_files, '../output/titanic_scores.csv')
 
 
 def main():
@@ -208,22 +531,35 @@ def main():
         my_emr.verbose_mode = True
         print "\nStarting Titanic Data Analysis"
     my_emr.parse_user_selections()
+    if "--terminate-warm" in sys.argv:
+        my_emr.terminate_warm_jobflow()
+        return
 
     # Setup
     my_emr.clear_local_output_directory()
-    my_emr.update_mapper_file("model2")
+    my_emr.write_model_file(*my_emr.model_choices)
 
-    # S3 activities
-    my_emr.empty_bucket()
-    my_emr.create_and_fill_bucket()
+    if my_emr.local_mode:
+        LocalProcessing(input_path=my_emr.input_file(),
+                        score=my_emr.score_mode).run()
+    else:
+        # S3 activities
+        my_emr.empty_bucket()
+        my_emr.create_and_fill_bucket()
 
-    # EMR activities
-    my_emr.setup_and_run_job()
-    my_emr.wait_until_job_completes()
+        # EMR activities
+        my_emr.setup_and_run_job()
+        my_emr.wait_until_job_completes()
+        my_emr.download_output_files()
 
     # Cleanup
-    my_emr.download_output_files()
-    my_emr.post_process_output_file()
+    if my_emr.score_mode:
+        my_emr.post_process_scores()
+        if my_emr.verbose_mode:
+            with open('../output/titanic_scores.csv', 'r') as scores_file:
+                print "\n" + scores_file.read()
+    else:
+        my_emr.post_process_output_file(model_names=my_emr.model_choices)
     if my_emr.verbose_mode:
         my_emr.print_local_output_files_stats()
 
@@ -238,6 +574,10 @@ class FlushFile(object): # pylint: disable=R0903
         self.single_file.write(data_to_write)
         self.single_file.flush()
 
+    def flush(self):
+        """Writes are already flushed, multiprocessing still calls this"""
+        self.single_file.flush()
+
 
 if __name__ == "__main__":
     # Replace stdout with an automatically flushing version
@@ -34,6 +34,9 @@ from ttk import Frame, Button, Style, Scrollbar, Checkbutton, OptionMenu
 from os.path import join, dirname
 from datetime import datetime
 
+sys.path.append(join(dirname(__file__), "mapper"))
+import survival_model # pylint: disable=F0401,C0413
+
 
 MAIN_PATH = join(dirname(__file__), "emr_titanic.py")
 
@@ -53,6 +56,7 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
         #   (Tk root window)
         self.textarea = None
         self.verbose_flag = StringVar()
+        self.emr_flag = StringVar()
         self.model = StringVar()
         self.region = StringVar()
         self.init_ui()       		# delegate creation of user interface
@@ -109,6 +113,8 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
         self.add_text("   Clear - clear this screen\n")
         self.add_text("   Silent - do not display logs, you usually want " \
             "verbose\n")
+        self.add_text("   EMR - run on EMR even when the input file is " \
+            "small enough to score here\n")
         self.add_text("   Model - which prediction model to use in order of " \
             "increasing complexity\n")
         self.add_text("   Region - which EMR server to use, currently set to " \
@@ -120,6 +126,9 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
         self.add_text(" The fields are passenger_id, prediction(0=died," \
             "1=survived), and gender\n")
         self.add_text("\n")
+        self.add_text(" Small input files are scored on this machine, which " \
+            "skips EMR entirely, unless EMR is checked\n")
+        self.add_text("\n")
         self.add_text(" Don't worry about 7+ minutes of STARTING messages, " \
             "AWS is setting up.  Sometimes when\n")
         self.add_text(" running on windows, the messages doen't update till " \
@@ -152,7 +161,7 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
         yscrollbar.config(command=self.textarea.yview)
 
     def setup_widgets(self):
-        """Five control widgets created along bottom"""
+        """Six control widgets created along bottom"""
 
         # clear button
         clear_button = Button(self, text="Clear")
@@ -164,19 +173,24 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
             variable=self.verbose_flag, onvalue="-s", offvalue="")
         verbose_check.grid(row=3, column=2, padx=5, pady=5)
 
+        # EMR even for small inputs, otherwise those are scored locally
+        emr_check = Checkbutton(self, text="EMR", \
+            variable=self.emr_flag, onvalue="--emr", offvalue="")
+        emr_check.grid(row=3, column=3, padx=5, pady=5)
+
         # Analysis model menu
-        choices2 = ['Select Model', 'model1', 'model2']
+        choices2 = ['Select Model'] + survival_model.load_registry().keys()
         om2 = OptionMenu(self, self.model, *choices2) # pylint: disable=W0142
-        om2.grid(row=3, column=3, padx=10, pady=20)
+        om2.grid(row=3, column=4, padx=10, pady=20)
 
         # EMR Server Region menu
         choices = ['Select Region', 'Oregon', 'California', 'Virginia']
         om1 = OptionMenu(self, self.region, *choices) # pylint: disable=W0142
-        om1.grid(row=3, column=4, padx=10, pady=20)
+        om1.grid(row=3, column=5, padx=10, pady=20)
 
         # Run EMR button
         emrbutton = Button(self, text="Run EMR")
-        emrbutton.grid(row=3, column=5, padx=5, pady=5)
+        emrbutton.grid(row=3, column=6, padx=5, pady=5)
         emrbutton.bind("<ButtonRelease-1>", self.run_emr)
 
     @staticmethod
@@ -215,7 +229,8 @@ class AssetBuilder(Frame):   # pylint: disable=R0901,R0904
             ("infostring", ))
 
         cmdlist = [x for x in [PYTHON_PATH, MAIN_PATH,
-            self.verbose_flag.get(), self.model.get(), self.region.get()]
+            self.verbose_flag.get(), self.emr_flag.get(), self.model.get(),
+            self.region.get()]
             if x]
 
         self.add_text(" ".join(cmdlist) + "\n", ("infostring", ))
@@ -0,0 +1,37 @@
+#!/bin/bash
+#
+# CREDENTIALS
+#   Module: idle_shutdown.sh
+#   Author: John Soper
+#   Date: Oct 18, 2026
+#   Rev: 1
+#
+# SUMMARY
+#   EMR bootstrap action of the --warm job flow, shuts the master node down
+#   once no hadoop job has run for the given number of seconds.  That
+#   terminates the job flow even if no later run comes back to do it
+#
+#       idle_shutdown.sh [idle seconds, default 3600]
+
+IDLE_SECONDS=${1:-3600}
+POLL_SECONDS=60
+
+# only the master runs the jobs, the other nodes go down with it
+grep -q '"isMaster": *true' /mnt/var/lib/info/instance.json || exit 0
+
+watch_idle() {
+    idle_since=$(date +%s)
+    while true; do
+        sleep $POLL_SECONDS
+        if hadoop job -list 2>/dev/null | grep -q '^ *job_'; then
+            idle_since=$(date +%s)
+        elif [ $(( $(date +%s) - idle_since )) -ge $IDLE_SECONDS ]; then
+            sudo shutdown -h now
+            exit 0
+        fi
+    done
+}
+
+# the job flow only starts once every bootstrap action has finished, so
+#   the watching goes on in the background
+watch_idle > /dev/null 2>&1 < /dev/null &
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+CREDENTIALS
+  Module: job_watcher.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Waits for an EMR job flow (or step) to finish, used by emr_titanic.py
+
+    The watcher only knows a describe callable returning the current state
+    name, so it works with a boto EMR connection, a step of a running job
+    flow, or a fake connection in the unit tests.
+
+    Polling backs off while nothing changes, slowly during cluster start up
+    where minutes go by without news, quickly while RUNNING so completion
+    is noticed soon after it happens.  With an expected running time the
+    interval shrinks as that time approaches, and backs off again after it.
+
+    Each state change is passed to the listeners as a StateTiming with how
+    long the previous state lasted.  A job still not finished after timeout
+    seconds is cancelled through the terminate callable and JobTimeout is
+    raised
+"""
+
+import time
+from collections import namedtuple
+
+# States a job flow or step never leaves
+TERMINAL_STATES = ('COMPLETED', 'TERMINATED', 'FAILED', 'CANCELLED',
+                   'INTERRUPTED', 'TERMINATED_WITH_ERRORS')
+
+# States of a cluster still being built
+STARTUP_STATES = ('STARTING', 'BOOTSTRAPPING', 'PENDING')
+
+# Hung job flows are terminated after this many seconds
+TIMEOUT = 2 * 60 * 60
+
+
+# state: the state that ended, next_state: the state entered,
+#   started: when state was first seen, duration: seconds spent in state
+StateTiming = namedtuple('StateTiming',
+                         'state next_state started duration')
+
+
+class JobTimeout(RuntimeError):
+    """ The job didn't finish in time and was terminated"""
+    pass
+
+
+class BackoffPolicy(object):
+    """ Seconds to wait before the next poll
+
+    The interval starts at the state's first interval and grows by factor
+    on every poll without a change, up to the state's limit
+    """
+
+    def __init__(self, startup=(15, 60), running=(2, 30), factor=1.5,
+                 expected_running=None):
+        self.startup = startup
+        self.running = running
+        self.factor = factor
+        self.expected_running = expected_running
+
+    def interval(self, state, polls, elapsed):
+        """ Wait after the polls-th unchanged poll, elapsed secs in state"""
+        first, limit = self.startup if state in STARTUP_STATES \
+            else self.running
+        wait = min(limit, first * self.factor ** polls)
+        if self.expected_running is not None and \
+                state not in STARTUP_STATES:
+            # halve the remaining time, completion is probably close, once
+            #   past it the job is late and the normal backoff resumes
+            remaining = self.expected_running - elapsed
+            if remaining > 0:
+                wait = min(wait, max(self.running[0], remaining / 2.0))
+        return wait
+
+
+class JobWatcher(object):
+    """ Polls describe() until it returns a terminal state"""
+
+    def __init__(self, describe, terminate=None, policy=None,
+                 timeout=TIMEOUT, clock=time.time, sleep=time.sleep):
+        self.describe = describe
+        self.terminate = terminate
+        self.policy = policy or BackoffPolicy()
+        self.timeout = timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.listeners = []
+        self.timings = []
+
+    def add_listener(self, listener):
+        """ listener(StateTiming) is called on every state change"""
+        self.listeners.append(listener)
+
+    def notify(self, timing):
+        """ Records a finished state and tells the listeners"""
+        self.timings.append(timing)
+        for listener in self.listeners:
+            listener(timing)
+
+    def watch(self):
+        """ Waits for a terminal state and returns it"""
+        start = self.clock()
+        state = self.describe()
+        state_start = start
+        polls = 0
+        while state not in TERMINAL_STATES:
+            now = self.clock()
+            if now - start >= self.timeout:
+                if self.terminate is not None:
+                    self.terminate()
+                self.notify(StateTiming(state, None, state_start,
+                                        now - state_start))
+                raise JobTimeout("still %s after %d seconds" %
+                                 (state, now - start))
+            wait = self.policy.interval(state, polls, now - state_start)
+            # never sleep past the timeout
+            self.sleep(max(0, min(wait, start + self.timeout - now)))
+            polls += 1
+            new_state = self.describe()
+            if new_state != state:
+                now = self.clock()
+                self.notify(StateTiming(state, new_state, state_start,
+                                        now - state_start))
+                state = new_state
+                state_start = now
+                polls = 0
+        return state
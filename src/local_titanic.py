@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+CREDENTIALS
+  Module: local_titanic.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Runs the hadoop mapper logic on this machine instead of on AWS EMR
+    Almost all of an EMR run on the small Kaggle input is cluster start up,
+    so emr_titanic.py uses this module for inputs below LOCAL_THRESHOLD
+
+    The input is cut into line aligned byte ranges, one per core, and a
+    multiprocessing Pool scores them with the same code the mapper uses.
+    Each worker reads its own range from the file so no input text is sent
+    between processes.  The result is written as ../output/part-00000,
+    sorted by PassengerId with every line ending in a tab the way hadoop
+    streaming writes a key without a value, so merge_output.py reads it
+    like any EMR part
+
+    When NumPy is installed the csv is converted once into a
+    passenger_columns.py file next to it, and the workers score memory
+    mapped row ranges of that instead of parsing the csv again
+
+    With score set the input is the labelled train.csv, each worker returns
+    its confusion counts and the part file holds their sums, as reducer.py
+    writes them on EMR
+"""
+
+import multiprocessing
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'mapper'))
+import mapper # pylint: disable=F0401,C0413
+import passenger_columns # pylint: disable=F0401,C0413
+import passenger_csv # pylint: disable=F0401,C0413
+import reducer # pylint: disable=F0401,C0413
+import survival_model # pylint: disable=F0401,C0413
+
+# Inputs smaller than this many bytes are scored locally by default
+LOCAL_THRESHOLD = 256 * 1024 * 1024
+
+
+def split_ranges(path, parts):
+    """ Cuts a file into at most parts (start, end) byte ranges
+
+    Every range starts at the beginning of a line and ends just after one
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as input_file:
+        for part in range(1, parts):
+            position = size * part // parts
+            if position <= boundaries[-1]:
+                continue
+            input_file.seek(position - 1)
+            input_file.readline()
+            position = input_file.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+    return zip(boundaries[:-1], boundaries[1:])
+
+
+def read_header(path, default=passenger_csv.DEFAULT_HEADER):
+    """ First line of the input if it's a header, else the default one"""
+    with open(path, 'r') as input_file:
+        first_line = input_file.readline()
+    if passenger_csv.PassengerReader.is_header(first_line):
+        return first_line
+    return default
+
+
+def score_range(task):
+    """ Pool worker, scores one byte range and returns the output lines"""
+    input_path, start, end, header, model_path, score = task
+    models = [model.compiled()
+              for model in survival_model.load_side_file(model_path)]
+    with open(input_path, 'rb') as input_file:
+        input_file.seek(start)
+        lines = input_file.read(end - start).splitlines()
+    if score:
+        reader = passenger_csv.PassengerReader(mapper.SCORE_FIELDS, header)
+        return mapper.count_lines(models,
+                                  mapper.confusion_counts(reader.read(lines),
+                                                          models))
+    reader = passenger_csv.PassengerReader(header=header)
+    output = []
+    for line in lines:
+        if line.strip():
+            output_line = mapper.score_line(line, reader, models)
+            if output_line is not None:
+                output.append(output_line)
+    return output
+
+
+def score_column_range(task):
+    """ Pool worker, scores rows start to end of a columnar file"""
+    columns_path, start, end, model_path = task
+    models = [model.compiled()
+              for model in survival_model.load_side_file(model_path)]
+    arrays = [mapper.lookup_arrays(model) for model in models]
+    return mapper.score_columns(
+        passenger_columns.PassengerColumns(columns_path), start, end, models,
+        arrays)
+
+
+def split_rows(rows, parts):
+    """ Cuts rows into at most parts (start, end) row ranges"""
+    boundaries = sorted(set(rows * part // parts for part in range(parts)))
+    return zip(boundaries, boundaries[1:] + [rows])
+
+
+class LocalProcessing(object):
+    """ Local stand in for the EMR job"""
+
+    def __init__(self, input_path='../data/test.csv',
+                 model_path='../src/mapper/model.json',
+                 output_path='../output/part-00000', processes=None,
+                 score=False, columns=None):
+        self.input_path = input_path
+        self.model_path = model_path
+        self.output_path = output_path
+        self.processes = processes or multiprocessing.cpu_count()
+        self.score = score
+        # the columnar copy is only used for predictions, and needs NumPy
+        self.columns = (mapper.np is not None and not score) \
+            if columns is None else columns
+
+    def run(self):
+        """ Scores the input on every core and writes the part file"""
+        if self.columns:
+            self.write_output(self.score_columns())
+            return
+        header = read_header(self.input_path, passenger_csv.TRAIN_HEADER
+                             if self.score else passenger_csv.DEFAULT_HEADER)
+        tasks = [(self.input_path, start, end, header, self.model_path,
+                  self.score)
+                 for start, end in split_ranges(self.input_path,
+                                                self.processes)]
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.map(score_range, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        output = []
+        for lines in results:
+            output.extend(lines)
+        self.write_output(output)
+
+    def score_columns(self):
+        """ Scores the columnar copy of the input, returns the output lines"""
+        columns_path = passenger_columns.converted(self.input_path)
+        columns = passenger_columns.PassengerColumns(columns_path)
+        tasks = [(columns_path, start, end, self.model_path)
+                 for start, end in split_rows(len(columns), self.processes)]
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.map(score_column_range, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+        output = []
+        if columns.has_header:
+            # not load_side_file, its cache would be inherited by the
+            #   workers of later runs
+            output.append(mapper.output_header(
+                survival_model.read_models(self.model_path)))
+        for lines in results:
+            output.extend(lines)
+        return output
+
+    def write_output(self, output):
+        """ Writes the output lines as the part file EMR would"""
+        # the reducer stage sorts its keys as plain text
+        output.sort()
+        if self.score:
+            with open(self.output_path, 'w') as output_file:
+                for model_name, counts in reducer.sum_counts(
+                        reducer.parse_counts(line) for line in output):
+                    output_file.write(
+                        reducer.format_counts(model_name, counts) + '\n')
+            return
+        with open(self.output_path, 'w') as output_file:
+            for line in output:
+                output_file.write("%s\t\n" % line)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: line_index.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Memory mapped text file with an index of where its lines start, for
+    the local runners
+
+    The newline index is built once over the memory map, with NumPy when
+    it's installed, and hands out (offset, length) spans of single lines.
+    A worker reads the text of a span from its own map of the file, so the
+    process holding the index never copies the input into Python strings.
+    Line ends are part of the spans, a last line without one is kept
+"""
+
+import mmap
+import os
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Maps opened by map_file, one per path and process
+_MAPS = {}
+
+
+def map_file(path):
+    """ Read only memory map of a whole file, empty files give ''"""
+    with open(path, 'rb') as input_file:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def mapped(path):
+    """ The memory map of a file, each file is only mapped once per
+    process"""
+    if path not in _MAPS:
+        _MAPS[path] = map_file(path)
+    return _MAPS[path]
+
+
+def read_span(path, span):
+    """ Text of one (offset, length) span of a file"""
+    offset, length = span
+    return mapped(path)[offset:offset + length]
+
+
+def line_bounds(data):
+    """ Start offset of every line in data followed by its size"""
+    size = len(data)
+    if np is not None:
+        if size == 0:
+            return np.zeros(1, dtype=np.int64)
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) ==
+                              ord('\n')) + 1
+        bounds = np.concatenate(([0], ends)).astype(np.int64)
+        if bounds[-1] != size:
+            bounds = np.append(bounds, size)
+        return bounds
+    bounds = array('L', [0])
+    position = data.find('\n')
+    while position != -1:
+        bounds.append(position + 1)
+        position = data.find('\n', position + 1)
+    if bounds[-1] != size:
+        bounds.append(size)
+    return bounds
+
+
+class LineIndex(object):
+    """ The lines of a memory mapped file, as a dictionary-like object of
+    line number to (offset, length) span"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = map_file(path)
+        self.bounds = line_bounds(self.data)
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __iter__(self):
+        return iter(xrange(len(self)))
+
+    def keys(self):
+        """ Line numbers, for callers expecting a dictionary"""
+        return range(len(self))
+
+    def __getitem__(self, line_number):
+        if not 0 <= line_number < len(self):
+            raise IndexError("line %d out of range" % line_number)
+        start = int(self.bounds[line_number])
+        return start, int(self.bounds[line_number + 1]) - start
+
+    def line(self, line_number):
+        """ Text of one line, with its line end"""
+        offset, length = self[line_number]
+        return self.data[offset:offset + length]
+
+    def close(self):
+        """ Unmaps the file"""
+        if self.data:
+            self.data.close()
+        self.data = ''
@@ -9,18 +9,44 @@ CREDENTIALS
 
 SUMMARY
     Custom map file for running Titanic Prediction project in hadoop
-    This map does not have a corresponding Reduce file
-    The survival tables are meant to be dynamically updated by other python
-    code, they're currently set so that everyone dies
+    Predictions need no Reduce file, scoring runs use reducer.py
+    The survival tables are not part of this file, they're loaded once at
+    startup from the model.json side file written by emr_titanic.py from the
+    models.json registry (see survival_model.py)
+
+    Every model in the side file is scored in the same pass over the input,
+    each adds a prediction column named after the model.  With only one
+    model the output is the Kaggle PassengerId,Survived format
 
     Prediction Score when entered in the Kaggle Titanic Competition
         Model 1: 76.555%
         Model 2: 77.990%
 
+    With --score, or when the job sets titanic.mode=score, the input is the
+    labelled train.csv and nothing is predicted per passenger.  Each model's
+    predictions are compared with the Survived column and the mapper only
+    emits one line of confusion counts per model at the end
+        <model>\t<true pos>,<false pos>,<false neg>,<true neg>
+    which reducer.py adds up over all the mappers
+
+    The input is scored a line at a time.  Runs given the --batch argument
+    score it in blocks of BLOCK_SIZE lines with one NumPy table lookup per
+    block instead, where NumPy is installed.  Parsing the csv lines takes
+    most of the time either way, so batch mode is no faster on stdin and
+    stays opt-in.  Both produce identical output
+
+    With --columns PATH the passengers are read from a passenger_columns.py
+    file instead of stdin, for local runs that skip csv parsing
+
+    Output is collected and written to stdout in chunks of BUFFER_SIZE
+    bytes (--buffer-size N to change it, 0 writes every line as soon as it
+    is scored).  With --typedbytes, or when the job sets
+    stream.map.output=typedbytes, the PassengerId and prediction are written
+    as Hadoop typed bytes ints, several predictions as a vector of ints
 
     This streaming mapper can be run on a Psuedo cluster instead of AWS EMR.
-    The instructions below will need slight tweaking, and the female table
-        will have to be hardcoded
+    The instructions below will need slight tweaking, and model.json will
+        have to be written first with survival_model.write_models
 
     RUN ONCE:
         export HADOOP_CONF_DIR=/Users/john/hadoop/configurations/psuedo
@@ -36,6 +62,8 @@ SUMMARY
         rm -f ./part*
         hadoop jar $STREAMJAR \
             -file ./mapper/mapper1.py  -mapper  ./mapper/mapper1.py  \
+            -file ./mapper/passenger_csv.py \
+            -file ./mapper/survival_model.py -file ./mapper/model.json \
             -input /user/wc/input/* \
             -output /user/wc/output
         hadoop fs -get /user/wc/output/part* .
@@ -49,39 +77,397 @@ RESOURCES
     www.kaggle.com tutorial code in the Titanic Machine Learning Competition
 """
 
+import os
+import struct
 import sys
+from itertools import islice
+from passenger_csv import PassengerReader, MODEL_FIELDS, TRAIN_HEADER
+from reducer import format_counts
+from passenger_columns import PassengerColumns
+from survival_model import MODEL_FILE, load_side_file
+
+try:
+    import numpy as np
+except ImportError:
+    # Not every Hadoop node has NumPy, --batch falls back to per-line there
+    np = None
+
+# Number of stdin lines scored together in batch mode
+BLOCK_SIZE = 65536
+
+# Bytes of output collected before each write to stdout
+BUFFER_SIZE = 1 << 20
+
+# Hadoop typed bytes type code of a 4 byte int, packed with its value
+TYPED_INT_PAIR = struct.Struct('>bibi')
+TYPED_INT_FIELD = struct.Struct('>bi')
+TYPED_INT = 3
+
+# Typed bytes type code of a vector, followed by its length
+TYPED_VECTOR = 8
+
+# Columns read from the labelled train.csv when scoring
+SCORE_FIELDS = MODEL_FIELDS + ('Survived',)
+
+
+class TextOutput(object):
+    """ Collects output lines and writes them to the stream in big chunks
+
+    A buffer_size of 0 writes every line as soon as it is given.  Scored
+    rows of (PassengerId, prediction of every model) are written as csv
+    """
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.pending_size = 0
+        # csv format of a row, by row length
+        self.row_formats = {}
+
+    def write_lines(self, lines):
+        """ Queues output lines, they must not have line endings"""
+        chunk = '\n'.join(lines) + '\n'
+        self.pending.append(chunk)
+        self.pending_size += len(chunk)
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def write_line(self, line):
+        """ Queues one output line"""
+        self.pending.append(line + '\n')
+        self.pending_size += len(line) + 1
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def write_header(self, header):
+        """ Queues the header line"""
+        self.write_line(header)
+
+    def row_format(self, length):
+        """ Format string of a row of that many values"""
+        if length not in self.row_formats:
+            self.row_formats[length] = '%s' + ',%d' * (length - 1)
+        return self.row_formats[length]
+
+    def write_row(self, row):
+        """ Queues one scored row"""
+        line = self.row_format(len(row)) % row
+        self.pending.append(line + '\n')
+        self.pending_size += len(line) + 1
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        """ Queues a list of scored rows"""
+        if rows:
+            line_format = self.row_format(len(rows[0]))
+            self.write_lines([line_format % row for row in rows])
+
+    def flush(self):
+        """ Writes everything queued so far"""
+        if self.pending:
+            self.stream.write(''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def close(self):
+        """ Writes the rest of the output and flushes the stream"""
+        self.flush()
+        self.stream.flush()
+
+
+class TypedBytesOutput(TextOutput):
+    """ Writes (PassengerId, prediction) pairs as Hadoop typed bytes ints
+
+    Used when the job sets stream.map.output=typedbytes, the header line is
+    dropped since the reducer stage only ever sees keys and values.  Rows
+    with several predictions get a vector of ints as their value.  The
+    scored values are packed as they are, no csv text is made
+    """
+
+    def write_header(self, header):
+        """ No header in typed bytes output"""
+        pass
+
+    @staticmethod
+    def pack_row(row):
+        """ Typed bytes of one scored row"""
+        if len(row) == 2:
+            return TYPED_INT_PAIR.pack(TYPED_INT, int(row[0]), TYPED_INT,
+                                       row[1])
+        pack = TYPED_INT_FIELD.pack
+        return (pack(TYPED_INT, int(row[0])) +
+                pack(TYPED_VECTOR, len(row) - 1) +
+                ''.join([pack(TYPED_INT, value) for value in row[1:]]))
+
+    def write_row(self, row):
+        """ Queues the typed bytes of one scored row"""
+        self.write_rows([row])
+
+    def write_rows(self, rows):
+        """ Queues the typed bytes of a list of scored rows"""
+        if rows and len(rows[0]) == 2:
+            pack = TYPED_INT_PAIR.pack
+            chunk = ''.join([pack(TYPED_INT, int(passenger_id), TYPED_INT,
+                                  prediction)
+                             for passenger_id, prediction in rows])
+        else:
+            pack_row = self.pack_row
+            chunk = ''.join([pack_row(row) for row in rows])
+        self.pending.append(chunk)
+        self.pending_size += len(chunk)
+        if self.pending_size >= self.buffer_size:
+            self.flush()
+
+
+def output_header(models):
+    """ Header line of the output, one prediction column per model"""
+    if len(models) == 1:
+        return 'PassengerId,Survived'
+    return ','.join(['PassengerId'] + [model.name for model in models])
+
+
+def score_line(line, reader, models):
+    """ Returns the output line for one line of csv input
+
+    models is the list of CompiledModels to score with.  Header lines after
+    the first give None
+    """
+    if reader.is_header(line):
+        reader.read_header(line)
+        # every shard of the input starts with the header, output it once
+        if reader.headers_seen == 1:
+            return output_header(models)
+        return None
+
+    passenger_id, pclass, sex, fare = reader.parse(line)
+    if len(models) == 1:
+        model = models[0]
+        return '%s,%d' % (passenger_id, model.table[model.sex_offsets[sex] +
+            model.class_offsets[pclass] + model.fare_bins[fare]])
+    return passenger_id + ''.join([',%d' % model.table[
+        model.sex_offsets[sex] + model.class_offsets[pclass] +
+        model.fare_bins[fare]] for model in models])
+
+
+def score_passenger(passenger, models):
+    """ (PassengerId, prediction of every model) of one parsed passenger"""
+    passenger_id, pclass, sex, fare = passenger
+    if len(models) == 1:
+        model = models[0]
+        return passenger_id, model.table[model.sex_offsets[sex] +
+            model.class_offsets[pclass] + model.fare_bins[fare]]
+    return (passenger_id,) + tuple([model.table[model.sex_offsets[sex] +
+        model.class_offsets[pclass] + model.fare_bins[fare]]
+                                    for model in models])
+
+
+def lookup_arrays(model):
+    """ NumPy form of a CompiledModel for the block scorers
+
+    Returns the flat table, an array mapping Pclass values to their table
+    offset (-1 for unknown classes) and the offset of the female half
+    """
+    flat_table = np.frombuffer(bytes(model.table), dtype=np.uint8)
+    class_offsets = np.empty(max(model.classes) + 1, dtype=np.intp)
+    class_offsets.fill(-1)
+    for pclass in model.classes:
+        class_offsets[pclass] = model.class_offsets[pclass]
+    return flat_table, class_offsets, model.sex_offsets['female']
+
+
+def block_rows(lines, reader, models, arrays):
+    """ Scores a block of csv lines with NumPy
+
+    Returns the output header if the block has the first header line of
+    the input, else None, and the scored rows of the block's passengers.
+    arrays is the list of lookup_arrays(model) of every model
+    """
+    header = None
+    passengers = []
+    for line in lines:
+        if reader.is_header(line):
+            reader.read_header(line)
+            if reader.headers_seen == 1:
+                header = output_header(models)
+        else:
+            passengers.append(reader.parse(line))
+    if not passengers:
+        return header, []
+
+    passenger_ids, pclasses, sexes, fares = zip(*passengers)
+    columns = predict_columns(models, arrays,
+                              np.array(pclasses).astype(np.intp),
+                              np.array(sexes) == 'female',
+                              np.array(fares).astype(np.float64))
+    return header, zip(passenger_ids, *columns)
+
+
+def predict_columns(models, arrays, pclasses, females, fares):
+    """ Prediction list of every model for arrays of passenger features
+
+    arrays is the list of lookup_arrays(model) of every model
+    """
+    columns = []
+    for model, (flat_table, class_offsets, female_offset) in zip(models,
+                                                                 arrays):
+        # a negative class would index from the end, check the range first
+        if len(pclasses) and (pclasses.min() < 0 or
+                              pclasses.max() >= len(class_offsets)):
+            raise KeyError("unknown passenger class in block")
+        codes = class_offsets[pclasses]
+        if (codes < 0).any():
+            raise KeyError("unknown passenger class in block")
+        codes += females * female_offset
+        codes += np.digitize(fares, model.fare_bins.edges)
+        # one gather per model for the whole block
+        columns.append(flat_table[codes].tolist())
+    return columns
+
+
+def columns_rows(columns, start, end, models, arrays):
+    """ Scored rows start to end of a PassengerColumns file"""
+    predictions = predict_columns(models, arrays,
+                                  columns.pclasses[start:end].astype(np.intp),
+                                  columns.females(start, end),
+                                  columns.fares[start:end].astype(np.float64))
+    return zip(columns.passenger_ids[start:end].tolist(), *predictions)
+
+
+def score_columns(columns, start, end, models, arrays):
+    """ Output lines of rows start to end of a PassengerColumns file
+
+    No header line is included
+    """
+    line_format = '%d' + ',%d' * len(models)
+    return [line_format % row for row in
+            columns_rows(columns, start, end, models, arrays)]
+
+
+def run_per_line(models, output):
+    """ Original line at a time mapper, needs no third party modules"""
+    reader = PassengerReader()
+    write_row = output.write_row
+    for line in sys.stdin:
+        if reader.is_header(line):
+            reader.read_header(line)
+            # every shard of the input starts with the header, output it once
+            if reader.headers_seen == 1:
+                output.write_header(output_header(models))
+        else:
+            write_row(score_passenger(reader.parse(line), models))
+    output.close()
+
+
+def run_batch(models, output):
+    """ Scores stdin in blocks of BLOCK_SIZE lines using NumPy"""
+    arrays = [lookup_arrays(model) for model in models]
+    reader = PassengerReader()
+    while True:
+        lines = list(islice(sys.stdin, BLOCK_SIZE))
+        if not lines:
+            break
+        header, rows = block_rows(lines, reader, models, arrays)
+        if header is not None:
+            output.write_header(header)
+        output.write_rows(rows)
+    output.close()
+
+
+def run_columns(models, output, columns_path):
+    """ Scores a passenger_columns file in blocks of BLOCK_SIZE rows"""
+    columns = PassengerColumns(columns_path)
+    arrays = [lookup_arrays(model) for model in models]
+    if columns.has_header:
+        output.write_header(output_header(models))
+    for start in range(0, len(columns), BLOCK_SIZE):
+        output.write_rows(columns_rows(columns, start,
+            min(start + BLOCK_SIZE, len(columns)), models, arrays))
+    output.close()
+
+
+def confusion_counts(passengers, models):
+    """ [true pos, false pos, false neg, true neg] of every model
+
+    passengers are SCORE_FIELDS tuples, the last field being the label
+    """
+    counts = [[0, 0, 0, 0] for _ in models]
+    for _, pclass, sex, fare, survived in passengers:
+        # 0 for survivors, so the count index is 2 * predicted + actual
+        actual = 1 - int(survived)
+        for model, model_counts in zip(models, counts):
+            predicted = 1 - model.table[model.sex_offsets[sex] +
+                model.class_offsets[pclass] + model.fare_bins[fare]]
+            model_counts[2 * predicted + actual] += 1
+    return counts
+
+
+def count_lines(models, counts):
+    """ Output lines of confusion_counts, in the format reducer.py reads"""
+    return [format_counts(model.name, model_counts)
+            for model, model_counts in zip(models, counts)]
+
+
+def run_scoring(models, output):
+    """ Scores the models against labelled input, emits only the counts"""
+    reader = PassengerReader(SCORE_FIELDS, TRAIN_HEADER)
+    counts = confusion_counts(reader.read(sys.stdin), models)
+    output.write_lines(count_lines(models, counts))
+    output.close()
+
+
+def option_value(name, default):
+    """ Value following name on the command line, or the default"""
+    if name in sys.argv:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def make_output():
+    """ Output writer selected by the command line or the job settings
+
+    Hadoop exports job settings to the environment with dots replaced by
+    underscores, so -D stream.map.output=typedbytes shows up here
+    """
+    buffer_size = int(option_value('--buffer-size', BUFFER_SIZE))
+    if ('--typedbytes' in sys.argv or
+            os.environ.get('stream_map_output') == 'typedbytes'):
+        return TypedBytesOutput(sys.stdout, buffer_size)
+    return TextOutput(sys.stdout, buffer_size)
+
+
+def model_file_path():
+    """ Side file given with --model, else model.json from the distributed
+    cache (the working directory) or next to this file"""
+    if '--model' in sys.argv:
+        return option_value('--model', None)
+    if os.path.exists(MODEL_FILE):
+        return MODEL_FILE
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        MODEL_FILE)
+
 
 def main():
     """ Mapper module for Map-Reduce run on AWS EMR """
-    female_survival_table = [[0, 0, 1, 1], [0, 1, 1, 1], [1, 1, 0, 0]]
-    male_survival_table = [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
+    # the models are loaded once, all of them are scored in one pass
+    models = [model.compiled()
+              for model in load_side_file(model_file_path())]
 
-    for line in sys.stdin:
-        # remove leading and trailing whitespace
-        line = line.strip()
+    if ('--score' in sys.argv or
+            os.environ.get('titanic_mode') == 'score'):
+        # a few short lines, always text for reducer.py
+        run_scoring(models, TextOutput(sys.stdout))
+        return
 
-        # split line of csv data by comma
-        words = line.split(',')
-        if words[0] == 'PassengerId':
-            print 'PassengerId,Survived'
-        else:
-            fare = float(words[9])
-            if fare >= 30.0:
-                fare_class = 3
-            elif fare >= 20.0:
-                fare_class = 2
-            elif fare >= 10.0:
-                fare_class = 1
-            else:
-                fare_class = 0
-
-            passenger_class = int(words[1]) -1
-            if words[4] == 'female':
-                print '%s,%d' % (words[0], \
-                    female_survival_table[passenger_class][fare_class])
-            else:
-                print '%s,%d' % (words[0], \
-                    male_survival_table[passenger_class][fare_class])
+    output = make_output()
+    if '--columns' in sys.argv:
+        # local runs over a converted passenger_columns file, not stdin
+        run_columns(models, output, option_value('--columns', None))
+    elif np is not None and '--batch' in sys.argv:
+        run_batch(models, output)
+    else:
+        run_per_line(models, output)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: passenger_columns.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Columnar binary copy of the model features of a passenger csv
+
+    The csv is converted once, afterwards every run reads the columns
+    through numpy.memmap without parsing any text or copying the data.
+    The file holds a HEADER followed by one column after the other
+        PassengerId  uint32 per passenger
+        Fare         float32 per passenger
+        Pclass       uint8 per passenger
+        Sex          one bit per passenger, 1 for female
+    all little endian.  The header records the size and modification time
+    of the csv it came from, so a changed csv is converted again.  Fares
+    are rounded to float32, which only matters for a fare within a few
+    millionths of a fare bin edge
+
+    Needs NumPy, runs without it use the csv
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+from itertools import islice
+from passenger_csv import PassengerReader
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# magic, version, flags, rows, csv size, csv mtime, padded to 32 bytes
+HEADER = struct.Struct('<4sHHIQd4x')
+MAGIC = 'TTNC'
+VERSION = 1
+
+# flags bit set when the csv started with a header line
+HAS_HEADER = 1
+
+# Suffix of the columnar copy next to its csv
+COLUMNS_SUFFIX = '.cols'
+
+# Rows converted at a time, a multiple of 8 to keep the sex bits aligned
+BLOCK_SIZE = 65536
+
+
+def columns_path_for(csv_path):
+    """ Where the columnar copy of a csv is kept"""
+    return os.path.splitext(csv_path)[0] + COLUMNS_SUFFIX
+
+
+def convert(csv_path, columns_path, block_size=BLOCK_SIZE):
+    """ Writes the columnar copy of a csv
+
+    The csv is read block_size rows at a time, each column goes to its own
+    temporary file until the row count for the header is known
+    """
+    reader = PassengerReader()
+    column_files = [tempfile.TemporaryFile() for _ in range(4)]
+    rows = 0
+    try:
+        with open(csv_path, 'rb') as csv_file:
+            has_header = reader.is_header(csv_file.readline())
+            csv_file.seek(0)
+            passengers = reader.read(csv_file)
+            while True:
+                block = list(islice(passengers, block_size))
+                if not block:
+                    break
+                rows += len(block)
+                passenger_ids, pclasses, sexes, fares = zip(*block)
+                np.array([int(value) for value in passenger_ids],
+                         dtype='<u4').tofile(column_files[0])
+                np.array([float(value) for value in fares],
+                         dtype='<f4').tofile(column_files[1])
+                np.array([int(value) for value in pclasses],
+                         dtype='u1').tofile(column_files[2])
+                np.packbits(np.array(sexes) == 'female').tofile(
+                    column_files[3])
+        stat = os.stat(csv_path)
+        with open(columns_path, 'wb') as columns_file:
+            columns_file.write(HEADER.pack(MAGIC, VERSION,
+                HAS_HEADER if has_header else 0, rows, stat.st_size,
+                stat.st_mtime))
+            for column_file in column_files:
+                column_file.seek(0)
+                shutil.copyfileobj(column_file, columns_file)
+    finally:
+        for column_file in column_files:
+            column_file.close()
+
+
+def read_header(columns_path):
+    """ (flags, rows, csv size, csv mtime) of a columnar file"""
+    with open(columns_path, 'rb') as columns_file:
+        magic, version, flags, rows, size, mtime = HEADER.unpack(
+            columns_file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("%s is not a passenger columns file" % columns_path)
+    return flags, rows, size, mtime
+
+
+def is_current(csv_path, columns_path):
+    """ True if the columnar file was converted from the csv as it is now"""
+    if not os.path.exists(columns_path):
+        return False
+    stat = os.stat(csv_path)
+    _, _, size, mtime = read_header(columns_path)
+    return size == stat.st_size and mtime == stat.st_mtime
+
+
+def converted(csv_path):
+    """ Path of an up to date columnar copy of the csv, converting it if
+    needed"""
+    columns_path = columns_path_for(csv_path)
+    if not is_current(csv_path, columns_path):
+        convert(csv_path, columns_path)
+    return columns_path
+
+
+class PassengerColumns(object):
+    """ The columns of a columnar file, memory mapped"""
+
+    def __init__(self, columns_path):
+        flags, rows, _, _ = read_header(columns_path)
+        self.has_header = bool(flags & HAS_HEADER)
+        self.rows = rows
+        offset = HEADER.size
+        self.passenger_ids = self.column(columns_path, '<u4', offset, rows)
+        offset += 4 * rows
+        self.fares = self.column(columns_path, '<f4', offset, rows)
+        offset += 4 * rows
+        self.pclasses = self.column(columns_path, 'u1', offset, rows)
+        offset += rows
+        self.female_bits = self.column(columns_path, 'u1', offset,
+                                       (rows + 7) // 8)
+
+    @staticmethod
+    def column(columns_path, dtype, offset, length):
+        """ Read only memory map of one column"""
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(columns_path, dtype=dtype, mode='r', offset=offset,
+                         shape=(length,))
+
+    def __len__(self):
+        return self.rows
+
+    def females(self, start, end):
+        """ Boolean female column of rows start to end"""
+        first_byte = start // 8
+        bits = np.unpackbits(self.female_bits[first_byte:(end + 7) // 8])
+        return bits[start - first_byte * 8:end - first_byte * 8].astype(bool)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: passenger_csv.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Quote aware csv tokenizer shared by the hadoop mapper, the local
+    mincemeat test and the output post-processing
+
+    Column positions are resolved once from the PassengerId header line, so
+    a Name field holding zero, one or several commas no longer shifts the
+    Sex and Fare columns.  Lines are only split as far as the last column a
+    caller asks for, and only those columns are returned.  The csv module
+    is kept for the rare lines with escaped quotes or several quoted fields
+
+    The hadoop mapper needs this file next to it, emr_titanic.py ships it
+    through the distributed cache
+"""
+
+import csv
+from operator import itemgetter
+
+# Column layout of the Kaggle test.csv, used until a header line is seen
+DEFAULT_HEADER = ('PassengerId,Pclass,Name,Sex,Age,SibSp,Parch,Ticket,Fare,'
+                  'Cabin,Embarked')
+
+# Column layout of the labelled Kaggle train.csv
+TRAIN_HEADER = ('PassengerId,Survived,Pclass,Name,Sex,Age,SibSp,Parch,'
+                'Ticket,Fare,Cabin,Embarked')
+
+# The only passenger columns the survival models read
+MODEL_FIELDS = ('PassengerId', 'Pclass', 'Sex', 'Fare')
+
+
+def split_csv(line):
+    """ Quote aware split of a complete csv line into all of its fields"""
+    line = line.rstrip('\r\n')
+    if '"' not in line:
+        return line.split(',')
+    pieces = line.split('"')
+    if len(pieces) == 3:
+        # a single quoted field without escaped quotes, like most Names
+        return (pieces[0].split(',')[:-1] + [pieces[1]] +
+                pieces[2].split(',')[1:])
+    return next(csv.reader([line]))
+
+
+class FieldSelector(object):
+    """ Pulls a fixed set of columns out of csv lines"""
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.last_column = max(self.columns)
+        getter = itemgetter(*self.columns)
+        if len(self.columns) == 1:
+            self.pick = lambda words: (getter(words),)
+        else:
+            self.pick = getter
+
+    def select(self, line):
+        """ Returns the wanted fields of one line, in the requested order
+
+        The line must already have its line ending removed
+        """
+        if '"' not in line:
+            # no quoting so a bounded split is exact
+            words = line.split(',', self.last_column + 1)
+        else:
+            pieces = line.split('"')
+            if len(pieces) == 3:
+                # one quoted field, split around it and no further than needed
+                words = pieces[0].split(',')
+                words[-1] = pieces[1]
+                remaining = self.last_column - len(words) + 2
+                if remaining > 0:
+                    words.extend(pieces[2].split(',', remaining)[1:])
+            else:
+                words = next(csv.reader([line]))
+        if len(words) <= self.last_column:
+            raise ValueError("too few columns in: %s" % line)
+        return self.pick(words)
+
+
+class PassengerReader(object):
+    """ Parses passenger lines into tuples of the requested fields
+
+    The column positions come from the most recent header line, or from
+    DEFAULT_HEADER when the input has no header at all
+    """
+
+    def __init__(self, fields=MODEL_FIELDS, header=DEFAULT_HEADER):
+        self.fields = tuple(fields)
+        self.selector = None
+        # header lines met in the input, sharded inputs have one per shard
+        self.headers_seen = 0
+        self.resolve_columns(header)
+
+    @staticmethod
+    def is_header(line):
+        """ True for the PassengerId,... header line"""
+        return line.lstrip().startswith('PassengerId')
+
+    def read_header(self, line):
+        """ Takes the column positions from a header line of the input"""
+        self.resolve_columns(line)
+        self.headers_seen += 1
+
+    def resolve_columns(self, line):
+        """ Resolves the column position of every wanted field"""
+        names = [name.strip() for name in split_csv(line.strip())]
+        try:
+            columns = [names.index(field) for field in self.fields]
+        except ValueError:
+            raise ValueError("header is missing one of %s: %s" %
+                             (', '.join(self.fields), line.strip()))
+        self.selector = FieldSelector(columns)
+
+    def parse(self, line):
+        """ Returns the wanted fields of one passenger line as a tuple"""
+        return self.selector.select(line.strip())
+
+    def read(self, lines):
+        """ Generates field lists for every passenger, headers are consumed"""
+        for line in lines:
+            if self.is_header(line):
+                self.read_header(line)
+            elif line.strip():
+                yield self.parse(line)
+
+
+_FILE_READERS = {}
+
+def file_reader(path):
+    """ PassengerReader of a csv file, its columns are resolved from the
+    file's header line once per process"""
+    if path not in _FILE_READERS:
+        reader = PassengerReader()
+        with open(path, 'r') as csv_file:
+            first_line = csv_file.readline()
+        if reader.is_header(first_line):
+            reader.read_header(first_line)
+        _FILE_READERS[path] = reader
+    return _FILE_READERS[path]
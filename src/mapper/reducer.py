@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: reducer.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Reduce file for the scoring runs of mapper.py
+    Every input line is a model name and comma separated confusion counts
+        <model>\t<true pos>,<false pos>,<false neg>,<true neg>
+    hadoop hands them over sorted by model, the counts of each model are
+    added up and written in the same format.  Since input and output match
+    this file also serves as the combiner
+
+    Prediction runs don't use it, their output only needs sorting
+"""
+
+import sys
+from itertools import groupby
+
+
+def parse_counts(line):
+    """ (model, list of counts) of one input line"""
+    model_name, counts = line.rstrip('\r\n').split('\t', 1)
+    return model_name, [int(count) for count in counts.split(',')]
+
+
+def sum_counts(records):
+    """ Generates (model, summed counts) of (model, counts) sorted by model"""
+    for model_name, group in groupby(records, key=lambda record: record[0]):
+        totals = None
+        for _, counts in group:
+            if totals is None:
+                totals = counts
+            else:
+                totals = [total + count
+                          for total, count in zip(totals, counts)]
+        yield model_name, totals
+
+
+def format_counts(model_name, counts):
+    """ Output line of one model's counts"""
+    return '%s\t%s' % (model_name, ','.join([str(count) for count in counts]))
+
+
+def main():
+    """ Reducer module for Map-Reduce run on AWS EMR"""
+    records = (parse_counts(line) for line in sys.stdin if line.strip())
+    for model_name, counts in sum_counts(records):
+        sys.stdout.write(format_counts(model_name, counts) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: survival_model.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Registry of named, versioned survival table models
+
+    Every model is a pair of survival tables (female and male) indexed by
+    passenger class and fare bin.  The class axis and the fare bin edges are
+    part of the model, so models are not limited to three classes and four
+    fare bins.
+
+    models.json next to this file is the registry of every known model.  A
+    run only ships the models it needs as a small model.json side file that
+    the hadoop mapper loads once at startup, so changing models never
+    changes the mapper code uploaded to S3.
+"""
+
+import json
+import os.path
+from bisect import bisect_right
+from collections import OrderedDict
+
+# Registry of all models, kept under version control
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'models.json')
+
+# Side file holding the models of one run, shipped to hadoop
+MODEL_FILE = 'model.json'
+
+# Most fares repeat, at most this many distinct fare strings are memoized
+FARE_CACHE_SIZE = 65536
+
+
+class SurvivalModel(object):
+    """ One named survival table model"""
+
+    def __init__(self, name, version, classes, fare_bins, female, male,
+                 description=""):
+        self.name = name
+        self.version = int(version)
+        self.classes = [int(pclass) for pclass in classes]
+        self.fare_bins = [float(edge) for edge in fare_bins]
+        self.female = [[int(value) for value in row] for row in female]
+        self.male = [[int(value) for value in row] for row in male]
+        self.description = description
+        self.class_index = dict((pclass, index)
+                                for index, pclass in enumerate(self.classes))
+        self.validate()
+        self._compiled = None
+
+    def validate(self):
+        """ Raises ValueError when the tables don't match the axes"""
+        if self.fare_bins != sorted(self.fare_bins):
+            raise ValueError("%s: fare bins must be increasing" % self.name)
+        bin_count = len(self.fare_bins) + 1
+        for table in (self.female, self.male):
+            if len(table) != len(self.classes) or \
+                    [len(row) for row in table] != [bin_count] * len(table):
+                raise ValueError("%s: tables must be %d classes by %d fare "
+                    "bins" % (self.name, len(self.classes), bin_count))
+
+    def fare_class(self, fare):
+        """ Fare bin of one fare, bins include their lower edge"""
+        return bisect_right(self.fare_bins, fare)
+
+    def predict(self, sex, pclass, fare):
+        """ 1 if the passenger is predicted to survive, otherwise 0"""
+        if sex == 'female':
+            table = self.female
+        else:
+            table = self.male
+        return table[self.class_index[int(pclass)]][self.fare_class(
+            float(fare))]
+
+    def compiled(self):
+        """ Flat lookup table form of the model, built on first use"""
+        if self._compiled is None:
+            self._compiled = CompiledModel(self)
+        return self._compiled
+
+    def to_dict(self):
+        """ JSON ready form of the model"""
+        return OrderedDict([
+            ('name', self.name),
+            ('version', self.version),
+            ('description', self.description),
+            ('classes', self.classes),
+            ('fare_bins', self.fare_bins),
+            ('female', self.female),
+            ('male', self.male)])
+
+    @classmethod
+    def from_dict(cls, fields):
+        """ Builds a model from its JSON form"""
+        return cls(fields['name'], fields['version'], fields['classes'],
+                   fields['fare_bins'], fields['female'], fields['male'],
+                   fields.get('description', ""))
+
+
+class FareBins(dict):
+    """ Memoized mapping of raw fare strings to fare bins"""
+
+    def __init__(self, edges):
+        dict.__init__(self)
+        self.edges = edges
+
+    def __missing__(self, fare):
+        fare_class = bisect_right(self.edges, float(fare))
+        if len(self) < FARE_CACHE_SIZE:
+            self[fare] = fare_class
+        return fare_class
+
+
+class SexOffsets(dict):
+    """ Table offset of each sex, anything but female uses the male table"""
+
+    def __missing__(self, sex):
+        return 0
+
+
+class CompiledModel(object):
+    """ A model flattened into one bytearray for branch free lookups
+
+    Entry (sex, class, fare_bin) is at the packed code
+        sex * classes * bins + class * bins + fare_bin
+    with male as sex 0.  The offsets are precomputed per raw field value,
+    so a passenger is scored with three dict lookups and one index
+    """
+
+    def __init__(self, model):
+        self.name = model.name
+        self.classes = model.classes
+        bin_count = len(model.fare_bins) + 1
+        self.table = bytearray()
+        for table in (model.male, model.female):
+            for row in table:
+                self.table.extend(row)
+        self.sex_offsets = SexOffsets(female=len(model.classes) * bin_count)
+        self.class_offsets = {}
+        for pclass, index in model.class_index.items():
+            self.class_offsets[pclass] = index * bin_count
+            self.class_offsets[str(pclass)] = index * bin_count
+        self.fare_bins = FareBins(model.fare_bins)
+
+    def predict(self, sex, pclass, fare):
+        """ 1 if the passenger is predicted to survive, otherwise 0"""
+        return self.table[self.sex_offsets[sex] + self.class_offsets[pclass] +
+                          self.fare_bins[fare]]
+
+
+def read_models(path):
+    """ Reads a registry or side file, returns the list of models"""
+    with open(path, 'r') as model_file:
+        contents = json.load(model_file)
+    return [SurvivalModel.from_dict(fields) for fields in contents['models']]
+
+
+def write_models(models, path):
+    """ Writes models in the same format read_models expects"""
+    contents = {'models': [model.to_dict() for model in models]}
+    with open(path, 'w') as model_file:
+        json.dump(contents, model_file, separators=(',', ':'))
+        model_file.write('\n')
+
+
+def load_registry(path=REGISTRY_FILE):
+    """ All registered models keyed by name, in registry order"""
+    return OrderedDict((model.name, model) for model in read_models(path))
+
+
+_SIDE_FILES = {}
+
+def load_side_file(path=MODEL_FILE):
+    """ Models of one run, each file is only read once per process"""
+    if path not in _SIDE_FILES:
+        _SIDE_FILES[path] = read_models(path)
+    return _SIDE_FILES[path]
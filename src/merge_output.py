@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+CREDENTIALS
+  Module: merge_output.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Streaming merge of every part-NNNNN output file into one csv sorted by
+    PassengerId, used by emr_titanic.py for post-processing
+
+    Parts already sorted by PassengerId are merged straight from disk with
+    heapq.merge.  Other parts are read max_records lines at a time, each
+    chunk is sorted and spilled to a temporary file, and the spill files
+    join the same merge.  Memory therefore stays at max_records records no
+    matter how large or how many the parts are, and the result is written
+    out line by line as the merge produces it
+
+    Lines that don't start with a PassengerId (normally just the header)
+    are written first, once each
+
+    A sweep over several models gives one prediction column per model,
+    split_models then writes each column as its own Kaggle csv
+
+    Scoring runs output confusion counts instead of predictions, write_scores
+    turns them into one accuracy line per model
+"""
+
+import heapq
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'mapper'))
+import passenger_csv # pylint: disable=F0401,C0413
+import reducer # pylint: disable=F0401,C0413
+
+# Records held in memory at once while sorting an unsorted part
+MAX_RECORDS = 1000000
+
+
+def output_header(model_names=None):
+    """ Header line of a merge, one prediction column per model as the
+    mapper writes it"""
+    if not model_names or len(model_names) == 1:
+        return "PassengerId,Survived"
+    return ','.join(['PassengerId'] + list(model_names))
+
+
+def parse_record(line):
+    """ (PassengerId, predictions) of one output line, None if unparseable
+
+    predictions is the comma separated prediction of every model
+    """
+    # typed bytes output is tab separated
+    line = line.strip().replace('\t', ',')
+    try:
+        csv_splits = passenger_csv.split_csv(line)
+        passenger_id = int(csv_splits[0])
+        # typed bytes vectors of several predictions come back as [1, 0]
+        predictions = ','.join(csv_splits[1:]).strip(',[] ').replace(' ', '')
+        if not predictions:
+            return None
+        return passenger_id, predictions
+    except (ValueError, IndexError):
+        return None
+
+
+def scan_part(path, unparseable_data):
+    """ True if the part is sorted by PassengerId
+
+    Unparseable lines found on the way are added to unparseable_data
+    """
+    is_sorted = True
+    previous = None
+    with open(path, 'r') as part_file:
+        for line in part_file:
+            record = parse_record(line)
+            if record is None:
+                line = line.strip()
+                if line not in unparseable_data:
+                    unparseable_data.append(line)
+            elif previous is not None and record < previous:
+                is_sorted = False
+            else:
+                previous = record
+    return is_sorted
+
+
+def read_records(path):
+    """ Generates the parseable records of an output or spill file"""
+    with open(path, 'r') as part_file:
+        for line in part_file:
+            record = parse_record(line)
+            if record is not None:
+                yield record
+
+
+def spill_sorted_runs(path, max_records, spill_files):
+    """ Sorts a part in chunks, each chunk is written to a spill file
+
+    The spill file paths are appended to spill_files
+    """
+    chunk = []
+    for record in read_records(path):
+        chunk.append(record)
+        if len(chunk) >= max_records:
+            spill_files.append(write_spill_file(chunk))
+            chunk = []
+    if chunk:
+        spill_files.append(write_spill_file(chunk))
+
+
+def write_spill_file(chunk):
+    """ Sorts one chunk of records into a new temporary file"""
+    chunk.sort()
+    handle, path = tempfile.mkstemp(prefix='titanic-spill-')
+    with os.fdopen(handle, 'w') as spill_file:
+        for record in chunk:
+            spill_file.write("%d,%s\n" % record)
+    return path
+
+
+def merge_part_files(part_paths, output_path, max_records=MAX_RECORDS,
+                     model_names=None):
+    """ Merges the part files into one csv sorted by PassengerId
+
+    model_names are the models the parts were scored with, they name the
+    prediction columns when the parts carry no header
+    """
+    unparseable_data = []
+    run_paths = []
+    spill_files = []
+    try:
+        for path in part_paths:
+            if scan_part(path, unparseable_data):
+                run_paths.append(path)
+            else:
+                spill_sorted_runs(path, max_records, spill_files)
+        run_paths.extend(spill_files)
+
+        with open(output_path, 'w') as output_file:
+            # start with lines that couldn't be parsed
+            # hopefully this will only be the original header
+            if not unparseable_data:
+                # typed bytes output carries no header line
+                unparseable_data.append(output_header(model_names))
+            for line in unparseable_data:
+                output_file.write("%s\n" % line)
+            for record in heapq.merge(*[read_records(path)
+                                        for path in run_paths]):
+                output_file.write("%d,%s\n" % record)
+    finally:
+        for path in spill_files:
+            os.remove(path)
+
+
+def split_models(merged_path, model_names, path_format):
+    """ Writes each prediction column of a sweep as its own Kaggle csv
+
+    path_format has a %s for the model name, returns the paths written
+    """
+    paths = [path_format % name for name in model_names]
+    output_files = [open(path, 'w') for path in paths]
+    try:
+        for output_file in output_files:
+            output_file.write("PassengerId,Survived\n")
+        for record in read_records(merged_path):
+            predictions = record[1].split(',')
+            for output_file, prediction in zip(output_files, predictions):
+                output_file.write("%d,%s\n" % (record[0], prediction))
+    finally:
+        for output_file in output_files:
+            output_file.close()
+    return paths
+
+
+def write_scores(part_paths, output_path):
+    """ Writes the accuracy and confusion counts of every model as a csv
+
+    Counts split over several parts are added up
+    """
+    records = []
+    for path in part_paths:
+        with open(path, 'r') as part_file:
+            records.extend(reducer.parse_counts(line)
+                           for line in part_file if line.strip())
+    records.sort()
+    with open(output_path, 'w') as output_file:
+        output_file.write("Model,Accuracy,TruePositive,FalsePositive,"
+                          "FalseNegative,TrueNegative\n")
+        for model_name, counts in reducer.sum_counts(records):
+            true_pos, false_pos, false_neg, true_neg = counts
+            accuracy = 100.0 * (true_pos + true_neg) / sum(counts)
+            output_file.write("%s,%.3f,%d,%d,%d,%d\n" % (model_name,
+                accuracy, true_pos, false_pos, false_neg, true_neg))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+CREDENTIALS
+  Module: s3_transfer.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Concurrent S3 uploads and downloads for emr_titanic.py
+
+    Files over MULTIPART_THRESHOLD are uploaded as a multipart upload whose
+    parts are sent by a thread pool, smaller files are uploaded whole but
+    several at a time.  Downloads of the output part files also run in the
+    thread pool.  All threads go through the one S3 connection the bucket
+    was opened with, boto keeps a pool of its HTTP connections.
+
+    Every transfer is checked against the S3 ETag, which is the md5 of the
+    file, or for multipart uploads the md5 of the part md5s followed by
+    "-<number of parts>".  A mismatch raises IOError
+
+    An optional UploadManifest remembers the ETag of everything uploaded.
+    Files whose content still matches the manifest and the key in S3 are
+    not uploaded again, so repeated runs over the same data only send what
+    changed
+
+    Works the same against a local S3 stand in such as moto
+"""
+
+import hashlib
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+# Files of at least this many bytes are uploaded in parts
+MULTIPART_THRESHOLD = 16 * 1024 * 1024
+
+# Size of each multipart upload part, S3 requires at least 5 MB
+PART_SIZE = 8 * 1024 * 1024
+
+# Transfers running at once
+THREADS = 8
+
+
+def part_ranges(size, part_size):
+    """ (part_number, offset, length) of every part of a file"""
+    return [(number + 1, offset, min(part_size, size - offset))
+            for number, offset in enumerate(range(0, size, part_size))]
+
+
+def file_md5(path, offset=0, length=None):
+    """ md5 object of length bytes of a file starting at offset"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as input_file:
+        input_file.seek(offset)
+        remaining = os.path.getsize(path) - offset if length is None \
+            else length
+        while remaining > 0:
+            data = input_file.read(min(remaining, 1 << 20))
+            if not data:
+                break
+            md5.update(data)
+            remaining -= len(data)
+    return md5
+
+
+def local_etag(path, part_size=PART_SIZE,
+               multipart_threshold=MULTIPART_THRESHOLD):
+    """ The ETag S3 will report for the file once S3Transfer uploads it"""
+    size = os.path.getsize(path)
+    if size < multipart_threshold:
+        return file_md5(path).hexdigest()
+    parts = part_ranges(size, part_size)
+    digests = ''.join(file_md5(path, offset, length).digest()
+                      for _, offset, length in parts)
+    return "%s-%d" % (hashlib.md5(digests).hexdigest(), len(parts))
+
+
+class UploadManifest(object):
+    """ Local record of uploaded files, saved as JSON
+
+    Entries are keyed by "bucket/key" and hold the local path, its size and
+    modification time when last hashed, and its ETag.  The size and time
+    let unchanged files skip hashing as well as uploading
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as manifest_file:
+                self.entries = json.load(manifest_file)
+
+    def save(self):
+        """ Writes the manifest back to disk"""
+        with open(self.path, 'w') as manifest_file:
+            json.dump(self.entries, manifest_file, indent=1, sort_keys=True)
+
+    def etag_of(self, path, bucket_name, key_name, part_size=PART_SIZE,
+                multipart_threshold=MULTIPART_THRESHOLD):
+        """ ETag of a local file, only hashed if it changed since recorded"""
+        entry = self.entries.get(bucket_name + '/' + key_name)
+        stat = os.stat(path)
+        if entry and entry['path'] == os.path.abspath(path) and \
+                entry['size'] == stat.st_size and \
+                entry['mtime'] == stat.st_mtime:
+            return entry['etag']
+        return local_etag(path, part_size, multipart_threshold)
+
+    def record(self, path, bucket_name, key_name, etag):
+        """ Remembers that the file is in S3 with the given ETag"""
+        stat = os.stat(path)
+        self.entries[bucket_name + '/' + key_name] = {
+            'path': os.path.abspath(path), 'size': stat.st_size,
+            'mtime': stat.st_mtime, 'etag': etag}
+
+
+def key_etag(key):
+    """ ETag of a boto key without its quotes"""
+    return (key.etag or '').strip('"')
+
+
+class S3Transfer(object):
+    """ Thread pooled, ETag checked transfers to and from one bucket"""
+
+    def __init__(self, bucket, threads=THREADS, part_size=PART_SIZE,
+                 multipart_threshold=MULTIPART_THRESHOLD, manifest=None):
+        self.bucket = bucket
+        self.threads = threads
+        self.part_size = part_size
+        self.multipart_threshold = multipart_threshold
+        self.manifest = manifest
+        self.skipped = []
+
+    def uploaded_etag(self, path, key_name):
+        """ ETag of the file if S3 already holds it under key_name, else
+        None"""
+        if self.manifest is None:
+            return None
+        etag = self.manifest.etag_of(path, self.bucket.name, key_name,
+                                     self.part_size, self.multipart_threshold)
+        key = self.bucket.get_key(key_name)
+        if key is None or key_etag(key) != etag:
+            return None
+        self.manifest.record(path, self.bucket.name, key_name, etag)
+        return etag
+
+    def upload_file(self, path, key_name, policy=None):
+        """ Uploads one file, returns its verified ETag"""
+        if os.path.getsize(path) < self.multipart_threshold:
+            key = self.bucket.new_key(key_name)
+            key.set_contents_from_filename(path, policy=policy)
+            etag = key_etag(key)
+        else:
+            etag = self.upload_multipart(path, key_name, policy)
+        expected = local_etag(path, self.part_size, self.multipart_threshold)
+        if etag != expected:
+            raise IOError("ETag mismatch uploading %s to %s: %s != %s" %
+                          (path, key_name, etag, expected))
+        return etag
+
+    def upload_multipart(self, path, key_name, policy=None):
+        """ Uploads the parts of one file concurrently, returns the ETag"""
+        upload = self.bucket.initiate_multipart_upload(key_name,
+                                                       policy=policy)
+
+        def upload_part(part):
+            """ Sends one part from its own file handle"""
+            part_number, offset, length = part
+            with open(path, 'rb') as input_file:
+                input_file.seek(offset)
+                upload.upload_part_from_file(input_file, part_number,
+                                             size=length)
+
+        pool = ThreadPool(self.threads)
+        try:
+            pool.map(upload_part, part_ranges(os.path.getsize(path),
+                                              self.part_size))
+        except Exception:
+            upload.cancel_upload()
+            raise
+        finally:
+            pool.close()
+            pool.join()
+        return upload.complete_upload().etag.strip('"')
+
+    def upload_files(self, uploads, policy=None):
+        """ Uploads (path, key_name) pairs concurrently, returns the ETag of
+        every key
+
+        Multipart files are sent one at a time since their parts already
+        use the whole thread pool.  Files the manifest shows are already
+        in S3 are skipped and listed in self.skipped, their ETags come from
+        the manifest
+        """
+        etags = {}
+        self.skipped = []
+        for path, key_name in uploads:
+            etag = self.uploaded_etag(path, key_name)
+            if etag is not None:
+                etags[key_name] = etag
+                self.skipped.append((path, key_name))
+        uploads = [upload for upload in uploads
+                   if upload not in self.skipped]
+        small = [(path, key_name) for path, key_name in uploads
+                 if os.path.getsize(path) < self.multipart_threshold]
+        pool = ThreadPool(self.threads)
+        try:
+            for key_name, etag in pool.map(
+                    lambda upload: (upload[1], self.upload_file(
+                        upload[0], upload[1], policy)), small):
+                etags[key_name] = etag
+        finally:
+            pool.close()
+            pool.join()
+        for path, key_name in uploads:
+            if key_name not in etags:
+                etags[key_name] = self.upload_file(path, key_name, policy)
+        if self.manifest is not None:
+            for path, key_name in uploads:
+                self.manifest.record(path, self.bucket.name, key_name,
+                                     etags[key_name])
+            self.manifest.save()
+        return etags
+
+    def download_key(self, key, path):
+        """ Downloads one key and checks it against the key's ETag"""
+        key.get_contents_to_filename(path)
+        etag = key_etag(key)
+        if os.path.getsize(path) != key.size:
+            raise IOError("size mismatch downloading %s" % key.name)
+        # multipart ETags depend on the unknown part size, so the size
+        # check above is all that can be done for them
+        if '-' not in etag and file_md5(path).hexdigest() != etag:
+            raise IOError("ETag mismatch downloading %s" % key.name)
+        return path
+
+    def download_keys(self, keys_and_paths):
+        """ Downloads (key, path) pairs concurrently, returns the paths"""
+        pool = ThreadPool(self.threads)
+        try:
+            return pool.map(lambda pair: self.download_key(*pair),
+                            keys_and_paths)
+        finally:
+            pool.close()
+            pool.join()
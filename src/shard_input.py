@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+CREDENTIALS
+  Module: shard_input.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Cuts the input csv into compressed shards for emr_titanic.py
+
+    Hadoop can't split a gzip file, so one big .gz input means one mapper.
+    Cutting the input into shards of about shard_size bytes (before
+    compression) gives a mapper per shard.  bz2 files can be split by hadoop
+    but are slower to compress, so gzip shards are the default.
+
+    Every shard starts with the header line so each mapper resolves the
+    columns by itself, the mapper only outputs the first header it sees.
+
+    gzip shards are written with a zero time stamp, so shards of unchanged
+    input are byte for byte the same and the upload manifest skips them
+"""
+
+import bz2
+import gzip
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'mapper'))
+import passenger_csv # pylint: disable=F0401,C0413
+
+# Uncompressed bytes of input per shard
+SHARD_SIZE = 64 * 1024 * 1024
+
+# File name suffix of each supported compression
+COMPRESSIONS = {None: '', 'gz': '.gz', 'bz2': '.bz2'}
+
+
+def open_shard(path, compression):
+    """ Opens a new shard file for writing"""
+    if compression == 'gz':
+        return gzip.GzipFile(path, 'wb', mtime=0)
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'wb')
+    return open(path, 'wb')
+
+
+def open_input(path):
+    """ Opens a plain, .gz or .bz2 input for reading"""
+    if path.endswith('.gz'):
+        return gzip.GzipFile(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+
+def shard_size_for(path, shards):
+    """ Shard size cutting the file into about shards pieces"""
+    return max(1, -(-os.path.getsize(path) // shards))
+
+
+def write_shards(input_path, output_dir, shard_size=SHARD_SIZE,
+                 compression='gz'):
+    """ Writes the shards of the input to output_dir, returns their paths
+
+    The shards are named after the input, e.g. test-00000.csv.gz
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError("unknown compression %s" % compression)
+    base, extension = os.path.splitext(os.path.basename(input_path))
+    paths = []
+    shard = None
+    shard_bytes = 0
+    with open(input_path, 'rb') as input_file:
+        header = input_file.readline()
+        if not passenger_csv.PassengerReader.is_header(header):
+            input_file.seek(0)
+            header = ''
+        try:
+            for line in input_file:
+                if shard is None or shard_bytes >= shard_size:
+                    if shard is not None:
+                        shard.close()
+                    paths.append(os.path.join(output_dir, "%s-%05d%s%s" % (
+                        base, len(paths), extension,
+                        COMPRESSIONS[compression])))
+                    shard = open_shard(paths[-1], compression)
+                    shard.write(header)
+                    shard_bytes = 0
+                shard.write(line)
+                shard_bytes += len(line)
+        finally:
+            if shard is not None:
+                shard.close()
+    return paths
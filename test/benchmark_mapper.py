@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: benchmark_mapper.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Measures streaming mapper throughput in rows/sec on a replicated copy
+    of data/test.csv.  The mapper runs as a child process with its stdout
+    on a pipe, the way hadoop streaming runs it.
+
+    "unbuffered" writes every line as soon as it's scored, like the
+    original print per passenger, the other modes use the chunked output
+
+        python benchmark_mapper.py [copies, default 500]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+MAPPER_DIR = os.path.join(TEST_DIR, '..', 'src', 'mapper')
+sys.path.append(MAPPER_DIR)
+import survival_model # pylint: disable=F0401,C0413
+
+MODES = [
+    ('per-line unbuffered', ['--buffer-size', '0']),
+    ('per-line buffered', []),
+    ('per-line typedbytes', ['--typedbytes']),
+    ('batch unbuffered', ['--batch', '--buffer-size', '0']),
+    ('batch buffered', ['--batch']),
+    ('batch typedbytes', ['--batch', '--typedbytes']),
+    ]
+
+
+def make_input(copies):
+    """ Writes test.csv repeated copies times, returns the path and rows"""
+    with open(os.path.join(TEST_DIR, '..', 'data', 'test.csv'), 'r') as csv:
+        lines = csv.readlines()
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w') as big_file:
+        big_file.write(lines[0])
+        for _ in range(copies):
+            big_file.writelines(lines[1:])
+    return path, copies * (len(lines) - 1)
+
+
+def time_mode(input_path, model_path, args):
+    """ Seconds taken by one mapper run, output is read and discarded"""
+    command = [sys.executable, os.path.join(MAPPER_DIR, 'mapper.py'),
+               '--model', model_path] + args
+    with open(input_path, 'r') as input_file:
+        start = time.time()
+        proc = subprocess.Popen(command, stdin=input_file,
+                                stdout=subprocess.PIPE)
+        while proc.stdout.read(1 << 16):
+            pass
+        proc.wait()
+    return time.time() - start
+
+
+def main():
+    """ Runs every mode and prints a rows/sec table"""
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    input_path, rows = make_input(copies)
+    model_path = tempfile.mkstemp(suffix='.json')[1]
+    survival_model.write_models([survival_model.load_registry()['model2']],
+                                model_path)
+    try:
+        print "%d rows" % rows
+        for name, args in MODES:
+            seconds = time_mode(input_path, model_path, args)
+            print "%-22s %8.2f s %12.0f rows/sec" % (name, seconds,
+                                                      rows / seconds)
+    finally:
+        os.remove(input_path)
+        os.remove(model_path)
+
+
+if __name__ == "__main__":
+    main()
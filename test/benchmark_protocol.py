@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: benchmark_protocol.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Bytes on the wire and encode/decode time per record of the mincemeat
+    map results of the Titanic job, for each payload encoding
+
+    The map results are the model2 predictions of data/test.csv repeated
+    copies times, each copy with its own PassengerIds, cut into map tasks
+    of every chunk size.  "original" is the protocol 0 pickle mincemeat
+    used to send, the others go through encode_payload and decode_payload
+
+        python benchmark_protocol.py [copies, default 100]
+"""
+
+import os
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TEST_DIR, '..', 'src', 'mapper'))
+import mincemeat # pylint: disable=F0401,C0413
+import passenger_csv # pylint: disable=F0401,C0413
+import survival_model # pylint: disable=F0401,C0413
+
+CHUNK_SIZES = [1, 64, 4096, mincemeat.MAX_CHUNK_SIZE]
+
+# name, pickle protocol, compact encoding, zlib threshold
+ENCODINGS = [
+    ('original', None, False, None),
+    ('protocol 2', 2, False, None),
+    ('protocol 2 compact', 2, True, None),
+    ('protocol 2 zlib', 2, False, mincemeat.ZLIB_THRESHOLD),
+    ('protocol 2 compact zlib', 2, True, mincemeat.ZLIB_THRESHOLD),
+    ]
+
+
+def map_results(copies):
+    """ (PassengerId, prediction) of every row of the repeated input"""
+    model = survival_model.load_registry()['model2'].compiled()
+    with open(os.path.join(TEST_DIR, '..', 'data', 'test.csv'), 'r') as csv:
+        passengers = list(passenger_csv.PassengerReader().read(csv))
+    return [(int(passenger_id) + copy * 10000,
+             model.predict(sex, pclass, fare))
+            for copy in range(copies)
+            for passenger_id, pclass, sex, fare in passengers]
+
+
+def make_tasks(results, chunk_size):
+    """ The mapdone payloads of map tasks of chunk_size records"""
+    return [(task_id, dict((key, [value]) for key, value in
+                           results[start:start + chunk_size]))
+            for task_id, start in enumerate(range(0, len(results),
+                                                  chunk_size))]
+
+
+def time_encoding(tasks, protocol, compact, zlib_threshold):
+    """ (bytes, encode seconds, decode seconds) of all the tasks"""
+    mincemeat.ZLIB_THRESHOLD = zlib_threshold or sys.maxint
+    start = time.time()
+    if protocol is None:
+        payloads = [(mincemeat.pickle.dumps(task), '') for task in tasks]
+    else:
+        payloads = [mincemeat.encode_payload(task, protocol, compact)
+                    for task in tasks]
+    encode_seconds = time.time() - start
+    start = time.time()
+    decoded = [mincemeat.decode_payload(payload, flags)
+               for payload, flags in payloads]
+    decode_seconds = time.time() - start
+    if decoded != tasks:
+        raise ValueError("payloads did not decode to the map results")
+    return (sum(len(payload) for payload, _ in payloads), encode_seconds,
+            decode_seconds)
+
+
+def main():
+    """ Times every encoding at every chunk size, prints a table"""
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    results = map_results(copies)
+    zlib_threshold = mincemeat.ZLIB_THRESHOLD
+    try:
+        print "%d records" % len(results)
+        print "%6s %-24s %10s %10s %10s" % ('chunk', '', 'bytes/rec',
+                                            'enc us/rec', 'dec us/rec')
+        for chunk_size in CHUNK_SIZES:
+            tasks = make_tasks(results, chunk_size)
+            for name, protocol, compact, threshold in ENCODINGS:
+                size, encode_seconds, decode_seconds = time_encoding(
+                    tasks, protocol, compact, threshold)
+                print "%6d %-24s %10.2f %10.2f %10.2f" % (chunk_size, name,
+                    float(size) / len(results),
+                    encode_seconds * 1e6 / len(results),
+                    decode_seconds * 1e6 / len(results))
+    finally:
+        mincemeat.ZLIB_THRESHOLD = zlib_threshold
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: benchmark_shards.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Wall clock time of a sharded input against its shard count, for picking
+    the --shards and --compress defaults of emr_titanic.py
+
+    A local pool of "nodes" stands in for the cluster.  Each node takes a
+    shard, decompresses it into a mapper.py child process the way hadoop
+    streaming feeds a map task, and drains the output.  With a single shard
+    only one node has work, so the times show how much parallelism the
+    shards buy against the cost of compressing them and running more tasks
+
+        python benchmark_shards.py [copies, default 200] [nodes, default cores]
+"""
+
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TEST_DIR, '..', 'src')
+MAPPER_DIR = os.path.join(SRC_DIR, 'mapper')
+sys.path.append(SRC_DIR)
+sys.path.append(MAPPER_DIR)
+import shard_input # pylint: disable=F0401,C0413
+import survival_model # pylint: disable=F0401,C0413
+from benchmark_mapper import make_input # pylint: disable=F0401,C0413
+
+SHARD_COUNTS = [1, 2, 4, 8, 16]
+COMPRESSIONS = ['gz', 'bz2']
+
+
+def run_map_task(task):
+    """ Pool worker, runs the mapper over one decompressed shard"""
+    shard_path, model_path = task
+    command = [sys.executable, os.path.join(MAPPER_DIR, 'mapper.py'),
+               '--model', model_path]
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE,
+                            stdout=open(os.devnull, 'w'))
+    shard = shard_input.open_input(shard_path)
+    try:
+        while True:
+            data = shard.read(1 << 16)
+            if not data:
+                break
+            proc.stdin.write(data)
+    finally:
+        shard.close()
+        proc.stdin.close()
+    return proc.wait()
+
+
+def time_shards(input_path, model_path, shards, compression, pool):
+    """ Seconds to shard and to map, and the compressed bytes"""
+    shard_dir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        paths = shard_input.write_shards(input_path, shard_dir,
+            shard_input.shard_size_for(input_path, shards), compression)
+        shard_seconds = time.time() - start
+        size = sum(os.path.getsize(path) for path in paths)
+        start = time.time()
+        pool.map(run_map_task, [(path, model_path) for path in paths],
+                 chunksize=1)
+        return shard_seconds, time.time() - start, size
+    finally:
+        shutil.rmtree(shard_dir)
+
+
+def main():
+    """ Times every compression and shard count, prints a table"""
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    nodes = int(sys.argv[2]) if len(sys.argv) > 2 else \
+        multiprocessing.cpu_count()
+    input_path, rows = make_input(copies)
+    model_path = tempfile.mkstemp(suffix='.json')[1]
+    survival_model.write_models([survival_model.load_registry()['model2']],
+                                model_path)
+    pool = multiprocessing.Pool(nodes)
+    try:
+        print "%d rows, %d bytes, %d nodes" % (rows,
+            os.path.getsize(input_path), nodes)
+        print "%-5s %7s %10s %10s %12s" % ('', 'shards', 'shard s', 'map s',
+                                          'bytes')
+        for compression in COMPRESSIONS:
+            for shards in SHARD_COUNTS:
+                shard_seconds, map_seconds, size = time_shards(
+                    input_path, model_path, shards, compression, pool)
+                print "%-5s %7d %10.2f %10.2f %12d" % (compression, shards,
+                    shard_seconds, map_seconds, size)
+    finally:
+        pool.close()
+        pool.join()
+        os.remove(input_path)
+        os.remove(model_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: benchmark_transport.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Wall clock time of a mincemeat job over TCP loopback against a Unix
+    domain socket, with and without shared memory segments for the large
+    payloads
+
+    Every map task is one value of the payload size, the map sends it back
+    as its result, so each payload crosses the connection twice.  The
+    clients are local processes as in launch_mr_func_test.py
+
+        python benchmark_transport.py [tasks, default 64] [workers, default 1]
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import mincemeat
+
+PAYLOAD_SIZES = [1024, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+PASSWORD = "changeme"
+PORT = mincemeat.DEFAULT_PORT + 2
+
+# name, Unix domain socket, shared memory
+TRANSPORTS = [
+    ('tcp loopback', False, False),
+    ('unix socket', True, False),
+    ('unix shared memory', True, True),
+    ]
+
+
+def echo_mapfn(key, value):
+    """ Map routine, sends the whole value back"""
+    yield key, value
+
+
+def size_reducefn(_, values):
+    """ Reduce routine, just the size of the value"""
+    return len(values[0])
+
+
+def run_worker(ready, unix_path, shared_memory):
+    """ Client process, connects once the server is ready"""
+    ready.wait()
+    client = mincemeat.Client()
+    client.password = PASSWORD
+    if unix_path:
+        client.conn_unix(unix_path, shared_memory)
+    else:
+        client.conn("localhost", PORT)
+
+
+def time_job(tasks, size, workers, unix_path, shared_memory):
+    """ Seconds from starting the clients to the results of one job"""
+    server = mincemeat.Server()
+    server.shared_memory = shared_memory
+    server.datasource = dict((key, os.urandom(size)) for key in range(tasks))
+    server.mapfn = echo_mapfn
+    server.reducefn = size_reducefn
+    server.chunk_size = 1
+    ready = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(ready, unix_path,
+                                               shared_memory))
+                 for _ in range(workers)]
+    start = time.time()
+    for process in processes:
+        process.start()
+    try:
+        results = server.run_server(PASSWORD, PORT, ready.set, unix_path)
+    finally:
+        for process in processes:
+            process.join()
+    seconds = time.time() - start
+    if results != dict.fromkeys(range(tasks), size):
+        raise ValueError("wrong results")
+    return seconds
+
+
+def main():
+    """ Times every transport at every payload size, prints a table"""
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    unix_path = os.path.join(tempfile.gettempdir(),
+                             'mincemeat-benchmark-%d.sock' % os.getpid())
+    print "%d tasks, %d workers" % (tasks, workers)
+    print "%10s %-20s %8s %10s" % ('payload', '', 'seconds', 'MB/sec')
+    for size in PAYLOAD_SIZES:
+        for name, unix, shared_memory in TRANSPORTS:
+            seconds = time_job(tasks, size, workers,
+                               unix_path if unix else None, shared_memory)
+            print "%10d %-20s %8.3f %10.1f" % (size, name, seconds,
+                2.0 * tasks * size / seconds / 1e6)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,101 @@
 CREDENTIALS
   Module: launch_mr_func_test.py
   Author: John Soper
-  Date: Apr 27, 2014
-  Rev: 1
+  Date: Oct 18, 2026
+  Rev: 2
 
 SUMMARY
-  Starts two processes so mincemeat does not have to be run in a 
+  Runs the mincemeat server of local_mr_func_test.py in this process along
+  with a mincemeat client process per core, so nothing has to be run in a
   separate window
+
+  The clients are started first and connect as soon as the server's port
+  is listening, then each reports its map tasks and the input lines they
+  mapped, and its reduce tasks and the keys they reduced, with the rate of
+  each.  A task also sent to a second client is counted by both, the
+  totals show how much work such duplicates added
+  --unix connects them through a Unix domain socket instead of TCP, add
+  --shared-memory to pass large payloads through shared memory as well
+
+        python launch_mr_func_test.py [model name] [--workers N] [--unix]
 """
 
+import multiprocessing
 import os
-import subprocess
-from time import sleep
+import sys
+import tempfile
+import time
+
+import mincemeat
+import local_mr_func_test
+
+
+def run_worker(ready, stats, unix_path, shared_memory):
+    """ Client process, connects once the server is ready and puts its
+    (pid, map tasks, map items, map seconds, reduce tasks, reduce keys,
+    reduce seconds) on stats when the job is done"""
+    ready.wait()
+    client = mincemeat.Client()
+    client.password = local_mr_func_test.PASSWORD
+    if unix_path:
+        client.conn_unix(unix_path, shared_memory)
+    else:
+        client.conn("localhost", mincemeat.DEFAULT_PORT)
+    stats.put((os.getpid(), client.maps_done, client.map_items,
+               client.map_seconds, client.reduces_done, client.reduce_keys,
+               client.reduce_seconds))
+
+
+def main():
+    """ Serves the job to a pool of local clients and reports on them"""
+    workers = multiprocessing.cpu_count()
+    if "--workers" in sys.argv:
+        workers = int(sys.argv[sys.argv.index("--workers") + 1])
+    unix_path = None
+    if "--unix" in sys.argv:
+        unix_path = os.path.join(tempfile.gettempdir(),
+                                 'mincemeat-%d.sock' % os.getpid())
+    shared_memory = "--shared-memory" in sys.argv
+    local_mr_func_test.write_model(sys.argv[1:])
+
+    server = local_mr_func_test.make_server()
+    server.shared_memory = shared_memory
+    start = time.time()
+    ready = multiprocessing.Event()
+    stats = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(ready, stats, unix_path,
+                                               shared_memory))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        results = server.run_server(password=local_mr_func_test.PASSWORD,
+                                    ready=ready.set, unix_path=unix_path)
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+    local_mr_func_test.write_results(results)
+    worker_stats = []
+    while not stats.empty():
+        worker_stats.append(stats.get())
+
+    print "%d results in %.2f s" % (len(results), time.time() - start)
+    print "%7s %6s %7s %10s %8s %7s %10s" % ('worker', 'maps', 'lines',
+        'lines/sec', 'reduces', 'keys', 'keys/sec')
+    for (pid, maps, items, map_seconds, reduces, keys,
+         reduce_seconds) in sorted(worker_stats):
+        print "%7d %6d %7d %10.0f %8d %7d %10.0f" % (pid, maps, items,
+            items / map_seconds if map_seconds else 0, reduces, keys,
+            keys / reduce_seconds if reduce_seconds else 0)
+    print "%d of %d lines and %d of %d keys were done twice" % (
+        sum(stat[2] for stat in worker_stats) - len(server.datasource),
+        len(server.datasource),
+        sum(stat[5] for stat in worker_stats) - len(results), len(results))
+    print "Done processing"
 
-subprocess.Popen("python local_mr_func_test.py", shell=True)
-sleep(5)
-os.system("python mincemeat.py -p changeme localhost")
-print "Done processing"
 
+if __name__ == "__main__":
+    main()
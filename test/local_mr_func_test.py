@@ -20,7 +20,7 @@ REQUIREMENTS
     If you want to run separately, the best way is to use two or more
     command line interfaces and start this module first:
 
-        python local_mr_func_test.py
+        python local_mr_func_test.py [model name, default model2]
         python mincemeat.py -p changeme localhost #in one or more CLIs
 
     When processing a large volume of input data, using multiple servers
@@ -44,49 +44,64 @@ REQUIREMENTS
 # Command line python likes this, but not above
 import mincemeat
 
-# Below is because pylint interprets all module-level variables as
-#     being 'constants'
-# pylint: disable-msg=C0103
+# The csv tokenizer and the models are shared with the hadoop mapper
+import os.path
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'src', 'mapper'))
+import line_index
+import survival_model
+
+INPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', 'data', 'test.csv')
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', 'output', 'local_titanic_test_data.csv')
+PASSWORD = "changeme"
+
+
+def write_model(args):
+    """ Writes the model named on the command line, default model2, to the
+    side file the mapper reads"""
+    registry = survival_model.load_registry()
+    model_name = "model2"
+    for arg in args:
+        if arg in registry:
+            model_name = arg
+    survival_model.write_models([registry[model_name]],
+        os.path.join(os.path.dirname(survival_model.REGISTRY_FILE),
+                     survival_model.MODEL_FILE))
 
-# Fill list by reading input file
-data = []
-with open('../data/test.csv', 'r') as input_file:
-    for line in input_file:
-        # sanitize data
-        line = line.replace('"', '').rstrip('\n').strip()
-        if line[0].isdigit():
-            data.append(line)
-
-# The data source can be any dictionary-like object
-#  enumerate - Iterate over indices and items of a list
-#  dict - create dictionary with given mapping values
-datasource = dict(enumerate(data))
 
 def mapfn(_, v):  #  Replace _ with k when using.  Changed for pylint
-    """ Mapper routine"""
-    passenger_fields = v.split(',')
-    fare = float(passenger_fields[9])
-    if fare >= 30.0:
-        fare_class = 3
-    elif fare >= 20.0:
-        fare_class = 2
-    elif fare >= 10.0:
-        fare_class = 1
-    else:
-        fare_class = 0
-    passenger_class = int(passenger_fields[1]) -1
-    male_survival_table = [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
-
-    # comment below in for model 1
-    #female_survival_table = [[1, 1, 1, 1], [1, 1, 1, 1], [1, 1, 1, 1]]
-    # comment below in for model 2
-    female_survival_table = [[0, 0, 1, 1], [0, 1, 1, 1], [1, 1, 0, 0]]
-
-    if passenger_fields[4] == 'male':
-        val = male_survival_table[passenger_class][fare_class]
-    else:
-        val = female_survival_table[passenger_class][fare_class]
-    yield int(passenger_fields[0]), val
+    """ Mapper routine, v is the (offset, length) span of one input line"""
+    # pylint: disable=W0404,W0621
+    # This runs inside the mincemeat client, so only the client's globals
+    #   are visible and the model modules have to be found from there
+    import os.path
+    import sys
+    mapper_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'src', 'mapper')
+    if mapper_dir not in sys.path:
+        sys.path.append(mapper_dir)
+    import line_index
+    import passenger_csv
+    import survival_model
+
+    input_path = os.path.join(mapper_dir, '..', '..', 'data', 'test.csv')
+    line = line_index.read_span(input_path, v)
+    if passenger_csv.PassengerReader.is_header(line) or not line.strip():
+        return
+    # the side file and the header line are only read on the first call
+    model = survival_model.load_side_file(
+        os.path.join(mapper_dir, survival_model.MODEL_FILE))[0].compiled()
+    passenger_id, pclass, sex, fare = \
+        passenger_csv.file_reader(input_path).parse(line)
+    yield int(passenger_id), model.predict(sex, pclass, fare)
+
+
+def collectfn(_, vs):  # Replace _ with k when using.  Changed for pylint
+    """ combiner, a passenger has one prediction so any one will do"""
+    return vs[0]
 
 
 def reducefn(_, vs):  # Replace _ with k when using.  Changed for pylint
@@ -94,15 +109,37 @@ def reducefn(_, vs):  # Replace _ with k when using.  Changed for pylint
     result = vs[0]
     return result
 
-s = mincemeat.Server()
-s.datasource = datasource
-s.mapfn = mapfn
-s.reducefn = reducefn
-
-# results is a dictionary
-results = s.run_server(password="changeme")
-with open('../output/local_titanic_test_data.csv', 'w') as output_file:
-    output_file.write("PassengerId,Survived\n")
-    for key in results:
-        output_file.write("%s,%s\n" % (key, results[key]))
+
+def make_server():
+    """ mincemeat server for the Titanic job"""
+    server = mincemeat.Server()
+    # The input is memory mapped and only the newline index is kept here,
+    #   the data source maps each line number to the (offset, length) span
+    #   of that line and the clients read the text themselves.  Any
+    #   dictionary-like object can be a data source
+    server.datasource = line_index.LineIndex(INPUT_FILE)
+    server.mapfn = mapfn
+    server.collectfn = collectfn
+    # the server keeps one combined prediction per passenger, not every value
+    server.incremental = True
+    server.reducefn = reducefn
+    return server
+
+
+def write_results(results):
+    """ Writes the results dictionary as the output csv"""
+    with open(OUTPUT_FILE, 'w') as output_file:
+        output_file.write("PassengerId,Survived\n")
+        for key in results:
+            output_file.write("%s,%s\n" % (key, results[key]))
+
+
+def main():
+    """ Serves the job to mincemeat clients started elsewhere"""
+    write_model(sys.argv[1:])
+    write_results(make_server().run_server(password=PASSWORD))
+
+
+if __name__ == "__main__":
+    main()
 
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: mapper_unit_tests.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Unit tests for the modules shipped to hadoop in src/mapper
+"""
+
+import unittest
+import os.path
+import struct
+import sys
+import tempfile
+from cStringIO import StringIO
+
+MAPPER_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src', 'mapper')
+sys.path.append(MAPPER_DIR)
+
+import passenger_csv
+import survival_model
+import mapper
+import reducer
+import passenger_columns
+
+# pylint: disable=R0904
+class TestPassengerCsv(unittest.TestCase):
+    """ Tokenizer tests"""
+
+    def setUp(self):
+        self.reader = passenger_csv.PassengerReader()
+
+    def test_name_comma_count(self):
+        """ Names with zero, one or two commas give the same fields"""
+        expected = ('892', '3', 'male', '7.8292')
+        for name in ['"Kelly Mr. James"', '"Kelly, Mr. James"',
+                     '"Kelly, Mr., James"', 'Kelly Mr. James']:
+            line = '892,3,%s,male,34.5,0,0,330911,7.8292,,Q\n' % name
+            self.assertEqual(self.reader.parse(line), expected,
+                "wrong fields for name " + name)
+
+    def test_escaped_quotes(self):
+        """ Doubled quotes inside a quoted field are kept intact"""
+        line = ('911,3,"Assaf Khalil, Mrs. Mariana (Miriam"")""",female,45,'
+                '0,0,2696,7.225,,C')
+        self.assertEqual(self.reader.parse(line),
+                         ('911', '3', 'female', '7.225'))
+        self.assertEqual(passenger_csv.split_csv(line)[2],
+                         'Assaf Khalil, Mrs. Mariana (Miriam")"')
+
+    def test_header_resolves_columns(self):
+        """ Columns follow the header, e.g. train.csv's extra Survived"""
+        lines = ['PassengerId,Survived,Pclass,Name,Sex,Age,SibSp,Parch,'
+                 'Ticket,Fare,Cabin,Embarked\n',
+                 '1,0,3,"Braund, Mr. Owen Harris",male,22,1,0,A/5 21171,'
+                 '7.25,,S\n']
+        self.assertEqual(list(self.reader.read(lines)),
+                         [('1', '3', 'male', '7.25')])
+
+    def test_file_reader(self):
+        """ A file's reader takes its columns from the header, once"""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write(passenger_csv.TRAIN_HEADER + '\n')
+        try:
+            reader = passenger_csv.file_reader(path)
+            self.assertEqual(reader.parse('1,0,3,"Braund, Mr. Owen Harris",'
+                                          'male,22,1,0,A/5 21171,7.25,,S'),
+                             ('1', '3', 'male', '7.25'))
+            self.assertTrue(passenger_csv.file_reader(path) is reader)
+        finally:
+            os.remove(path)
+
+    def test_missing_column(self):
+        """ Short lines raise ValueError instead of returning garbage"""
+        self.assertRaises(ValueError, self.reader.parse, '892,3,"Kelly"')
+        self.assertRaises(ValueError, self.reader.read_header,
+                          'PassengerId,Name')
+
+
+class TestSurvivalModel(unittest.TestCase):
+    """ Model registry tests"""
+
+    def test_registry_models(self):
+        """ Registered models keep their tables and fare bins"""
+        registry = survival_model.load_registry()
+        self.assertEqual(registry.keys()[:2], ['model1', 'model2'])
+        model = registry['model2']
+        self.assertEqual(model.fare_bins, [10.0, 20.0, 30.0])
+        self.assertEqual(model.predict('female', '1', '30'), 1)
+        self.assertEqual(model.predict('female', '3', '29.99'), 0)
+        self.assertEqual(model.predict('female', '3', '9.5'), 1)
+        self.assertEqual(model.predict('male', '1', '100'), 0)
+
+    def test_custom_axes(self):
+        """ Class axis and fare bins come from the model"""
+        model = survival_model.SurvivalModel('two_bins', 3, [1, 2],
+            [50], female=[[1, 1], [0, 1]], male=[[0, 1], [0, 0]])
+        self.assertEqual(model.predict('male', '1', '50'), 1)
+        self.assertEqual(model.predict('female', '2', '49'), 0)
+        self.assertRaises(ValueError, survival_model.SurvivalModel, 'bad',
+            1, [1, 2, 3], [50], female=[[1, 1]], male=[[0, 0]])
+
+    def test_compiled_matches_tables(self):
+        """ The flat table gives the same answers as the nested tables"""
+        model = survival_model.load_registry()['model2']
+        compiled = model.compiled()
+        self.assertEqual(len(compiled.table), 24)
+        for sex in ['female', 'male']:
+            for pclass in ['1', '2', '3']:
+                for fare in ['0', '9.99', '10', '15.5', '20', '29', '30',
+                             '512.3292']:
+                    self.assertEqual(compiled.predict(sex, pclass, fare),
+                        model.predict(sex, pclass, fare))
+        self.assertEqual(compiled.fare_bins['15.5'], 1)
+        self.assertTrue('15.5' in compiled.fare_bins, "fare not memoized")
+
+
+class TestMapper(unittest.TestCase):
+    """ Scoring tests"""
+
+    def setUp(self):
+        self.models = [survival_model.load_registry()['model2'].compiled()]
+        with open(os.path.join(MAPPER_DIR, '..', '..', 'data', 'test.csv'),
+                  'r') as input_file:
+            self.lines = input_file.readlines()
+
+    def test_per_line_scoring(self):
+        """ Spot check the line at a time scorer"""
+        reader = passenger_csv.PassengerReader()
+        output = [mapper.score_line(line, reader, self.models)
+                  for line in self.lines]
+        self.assertEqual(output[0], 'PassengerId,Survived')
+        self.assertEqual(output[1:3], ['892,0', '893,1'])
+        self.assertEqual(len(output), len(self.lines))
+
+    def run_mapper(self, run, models):
+        """ Output of a mapper run function over the test data as stdin"""
+        stream = StringIO()
+        stdin = sys.stdin
+        sys.stdin = StringIO(''.join(self.lines))
+        try:
+            run(models, mapper.TextOutput(stream))
+        finally:
+            sys.stdin = stdin
+        return stream.getvalue()
+
+    @unittest.skipIf(mapper.np is None, "NumPy not installed")
+    def test_batch_matches_per_line(self):
+        """ --batch output is identical to the per-line output, in blocks
+        smaller than the input"""
+        expected = self.run_mapper(mapper.run_per_line, self.models)
+        self.assertTrue(expected.startswith('PassengerId,Survived\n892,0\n'))
+        block_size = mapper.BLOCK_SIZE
+        try:
+            mapper.BLOCK_SIZE = 100
+            self.assertEqual(self.run_mapper(mapper.run_batch, self.models),
+                             expected)
+        finally:
+            mapper.BLOCK_SIZE = block_size
+
+    @unittest.skipIf(mapper.np is None, "NumPy not installed")
+    def test_batch_unknown_class(self):
+        """ Classes outside the model raise KeyError, none wrap around"""
+        arrays = [mapper.lookup_arrays(model) for model in self.models]
+        for pclass in (-1, 0, 4):
+            self.assertRaises(KeyError, mapper.predict_columns, self.models,
+                              arrays, mapper.np.array([1, pclass]),
+                              mapper.np.array([False, True]),
+                              mapper.np.array([7.25, 7.25]))
+
+    def test_model_sweep(self):
+        """ Every model gets its own column, matching a run of that model"""
+        registry = survival_model.load_registry()
+        models = [model.compiled() for model in registry.values()]
+        reader = passenger_csv.PassengerReader()
+        output = [mapper.score_line(line, reader, models)
+                  for line in self.lines]
+        self.assertEqual(output[0], 'PassengerId,' + ','.join(registry))
+        for column, model in enumerate(models):
+            reader = passenger_csv.PassengerReader()
+            single = [mapper.score_line(line, reader, [model])
+                      for line in self.lines[1:]]
+            self.assertEqual([line.split(',')[column + 1]
+                              for line in output[1:]],
+                             [line.split(',')[1] for line in single])
+        self.assertEqual(self.run_mapper(mapper.run_per_line, models),
+                         '\n'.join(output) + '\n')
+        if mapper.np is not None:
+            self.assertEqual(self.run_mapper(mapper.run_batch, models),
+                             '\n'.join(output) + '\n')
+
+    def test_confusion_counts(self):
+        """ Labels equal to model2's predictions score model2 perfectly"""
+        models = [model.compiled()
+                  for model in survival_model.load_registry().values()]
+        reader = passenger_csv.PassengerReader()
+        passengers = [(passenger_id, pclass, sex, fare,
+                       str(self.models[0].predict(sex, pclass, fare)))
+                      for passenger_id, pclass, sex, fare in
+                      reader.read(self.lines)]
+        counts = mapper.confusion_counts(passengers, models)
+        survivors = len([passenger for passenger in passengers
+                         if passenger[-1] == '1'])
+        model2 = counts[[model.name for model in models].index('model2')]
+        self.assertEqual(model2, [survivors, 0, 0,
+                                  len(passengers) - survivors])
+        for model_counts in counts:
+            self.assertEqual(sum(model_counts), len(passengers))
+        self.assertEqual(mapper.count_lines(models[:1], counts[:1]),
+                         ['model1\t%s' % ','.join(map(str, counts[0]))])
+
+    def test_reducer_sums_counts(self):
+        """ Counts of the same model are added, models stay apart"""
+        records = [reducer.parse_counts(line) for line in
+                   ['model1\t1,2,3,4\n', 'model1\t10,20,30,40\n',
+                    'model2\t0,1,0,1\n']]
+        self.assertEqual(list(reducer.sum_counts(records)),
+                         [('model1', [11, 22, 33, 44]),
+                          ('model2', [0, 1, 0, 1])])
+        self.assertEqual(reducer.format_counts('model1', [11, 22, 33, 44]),
+                         'model1\t11,22,33,44')
+
+    @unittest.skipIf(mapper.np is None, "NumPy not installed")
+    def test_columns_match_csv(self):
+        """ The columnar copy scores exactly like the csv"""
+        handle, columns_path = tempfile.mkstemp(suffix='.cols')
+        os.close(handle)
+        csv_path = os.path.join(MAPPER_DIR, '..', '..', 'data', 'test.csv')
+        try:
+            # small blocks check the sex bits line up across blocks
+            passenger_columns.convert(csv_path, columns_path, block_size=64)
+            self.assertTrue(passenger_columns.is_current(csv_path,
+                                                         columns_path))
+            columns = passenger_columns.PassengerColumns(columns_path)
+            self.assertTrue(columns.has_header)
+            self.assertEqual(len(columns), len(self.lines) - 1)
+            reader = passenger_csv.PassengerReader()
+            expected = [mapper.score_line(line, reader, self.models)
+                        for line in self.lines[1:]]
+            arrays = [mapper.lookup_arrays(model) for model in self.models]
+            # ranges not on byte boundaries of the sex bits
+            output = []
+            for start in range(0, len(columns), 37):
+                output.extend(mapper.score_columns(columns, start,
+                    min(start + 37, len(columns)), self.models, arrays))
+            self.assertEqual(output, expected)
+        finally:
+            os.remove(columns_path)
+
+    def test_buffered_output(self):
+        """ Output only reaches the stream in chunks, and all of it does"""
+        stream = StringIO()
+        output = mapper.TextOutput(stream, buffer_size=20)
+        output.write_line('PassengerId,Survived')
+        self.assertEqual(stream.getvalue(), 'PassengerId,Survived\n')
+        output.write_rows([('892', 0)])
+        output.write_row(('893', 1))
+        self.assertEqual(stream.getvalue(), 'PassengerId,Survived\n')
+        output.close()
+        self.assertEqual(stream.getvalue(),
+                         'PassengerId,Survived\n892,0\n893,1\n')
+
+    def test_typedbytes_output(self):
+        """ Typed bytes output is int pairs with the header dropped"""
+        stream = StringIO()
+        output = mapper.TypedBytesOutput(stream)
+        output.write_header('PassengerId,Survived')
+        output.write_rows([('892', 0)])
+        output.write_row((893, 1))
+        output.close()
+        self.assertEqual(stream.getvalue(),
+                         struct.pack('>bibibibi', 3, 892, 3, 0, 3, 893, 3, 1))
+
+    def test_typedbytes_sweep_output(self):
+        """ Several predictions are written as a vector of ints"""
+        stream = StringIO()
+        output = mapper.TypedBytesOutput(stream)
+        output.write_header('PassengerId,model1,model2')
+        output.write_rows([('892', 0, 1)])
+        output.close()
+        self.assertEqual(stream.getvalue(),
+                         struct.pack('>bibibibi', 3, 892, 8, 2, 3, 0, 3, 1))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -25,27 +25,220 @@
 
 import asynchat
 import asyncore
+import bisect
 import cPickle as pickle
 import hashlib
 import hmac
 import logging
 import marshal
+import mmap
 import optparse
 import os
-import random
 import socket
 import sys
+import tempfile
+import time
 import types
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import islice
 
 VERSION = "0.1.2"
 
 
 DEFAULT_PORT = 11235
 
+# Map tasks aim to take about this long when the chunk size is adaptive
+TARGET_TASK_SECONDS = 0.25
+
+# Upper bound on the datasource items sent in one map task
+MAX_CHUNK_SIZE = 10000
+
+# Tasks kept outstanding on each client, so it never waits a round trip
+#   for its next task
+DEFAULT_WINDOW = 2
+
+# A task is only sent to a second client once it has run longer than this
+#   share of the finished tasks took, per item
+SPECULATIVE_PERCENTILE = 0.9
+
+# Nor before it has run this many seconds, tasks of microseconds per item
+#   would otherwise look stalled while their result is still on the wire
+MIN_SPECULATION_SECONDS = 1.0
+
+# Times a task is sent out at most, the first time included
+MAX_ATTEMPTS = 2
+
+# Seconds between checks for stalled tasks while clients are idle
+SPECULATION_POLL_SECONDS = 1.0
+
+# Reduce tasks, every key goes to the one its hash picks
+DEFAULT_REDUCE_PARTITIONS = 16
+
+# With shared memory on, payloads larger than this go through a memory
+#   mapped segment and only the segment's name through the Unix socket
+SHARED_MEMORY_THRESHOLD = 4 * 1024 * 1024
+
+# Where the segments are made, tmpfs when there is one
+SEGMENT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else \
+    tempfile.gettempdir()
+SEGMENT_PREFIX = 'mincemeat-'
+
+# Highest pickle protocol this end reads, both ends send with the lower of
+#   their two once they have told each other
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+# Payload encodings this end reads: c compact map results, z zlib and m
+#   shared memory segments (Unix socket connections only).  Each end only
+#   sends the ones the other end has named
+ENCODINGS = 'czm'
+
+# Payloads larger than this many bytes are zlib compressed
+ZLIB_THRESHOLD = 64 * 1024
+
+# unless their first ZLIB_PROBE_SIZE bytes don't compress below
+#   ZLIB_PROBE_RATIO of that, e.g. already compressed data
+ZLIB_PROBE_SIZE = 4096
+ZLIB_PROBE_RATIO = 0.9
+
+# Map results with fewer keys are pickled as they are, the compact encoding
+#   only pays off on bigger ones
+COMPACT_MIN_KEYS = 32
+
+# Array types the compact encoding tries, smallest first
+COMPACT_TYPECODES = ('B', 'b', 'H', 'h', 'i')
+
+
+def pack_ints(values):
+    """ (typecode, little endian bytes) of ints in the smallest array type
+    holding them all, None if none does"""
+    for typecode in COMPACT_TYPECODES:
+        try:
+            packed = array(typecode, values)
+        except OverflowError:
+            continue
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return typecode, packed.tostring()
+    return None
+
+
+def unpack_ints(typecode, data):
+    """ The list of ints pack_ints stored as (typecode, bytes)"""
+    unpacked = array(typecode)
+    unpacked.fromstring(data)
+    if sys.byteorder == 'big':
+        unpacked.byteswap()
+    return unpacked.tolist()
+
+
+def compact_results(data):
+    """ Compact form of a (task id, {int key: [int values]}) map result, as
+    arrays of the keys, the value counts and all values.  None for any
+    other data"""
+    if not (isinstance(data, tuple) and len(data) == 2 and
+            isinstance(data[1], dict) and len(data[1]) >= COMPACT_MIN_KEYS):
+        return None
+    keys = data[1].keys()
+    value_lists = data[1].values()
+    if not (all(type(key) is int for key in keys) and
+            all(type(value_list) is list for value_list in value_lists)):
+        return None
+    flat = [value for value_list in value_lists for value in value_list]
+    if not all(type(value) is int for value in flat):
+        return None
+    columns = (pack_ints(keys),
+               pack_ints([len(value_list) for value_list in value_lists]),
+               pack_ints(flat))
+    if None in columns:
+        return None
+    return data[0], columns
+
+
+def expand_results(data):
+    """ The map result compact_results came from"""
+    task_id, columns = data
+    keys, counts, values = [unpack_ints(typecode, packed)
+                            for typecode, packed in columns]
+    results = {}
+    position = 0
+    for key, count in zip(keys, counts):
+        results[key] = values[position:position + count]
+        position += count
+    return task_id, results
+
+
+def write_segment(data):
+    """ Writes data into a new memory mapped segment, returns its name"""
+    handle, path = tempfile.mkstemp(prefix=SEGMENT_PREFIX, dir=SEGMENT_DIR)
+    try:
+        os.ftruncate(handle, len(data))
+        segment = mmap.mmap(handle, len(data))
+        segment[:] = data
+        segment.close()
+    finally:
+        os.close(handle)
+    return os.path.basename(path)
+
+
+def segment_path(name):
+    """ Path of the segment write_segment named"""
+    if not name.startswith(SEGMENT_PREFIX) or os.sep in name:
+        raise ValueError("not a mincemeat segment: %r" % name)
+    return os.path.join(SEGMENT_DIR, name)
+
+
+def read_segment(name):
+    """ Data of the segment write_segment named, the segment is removed"""
+    path = segment_path(name)
+    try:
+        with open(path, 'rb') as segment_file:
+            segment = mmap.mmap(segment_file.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+            data = segment[:]
+            segment.close()
+    finally:
+        os.remove(path)
+    return data
+
+
+def encode_payload(data, pickle_protocol=0, compact=True, compress=True):
+    """ (payload, encoding flags) of data, flags has c for the compact
+    encoding and z for zlib.  compact and compress allow each encoding"""
+    flags = ''
+    if compact:
+        compacted = compact_results(data)
+        if compacted is not None:
+            data = compacted
+            flags += 'c'
+    payload = pickle.dumps(data, pickle_protocol)
+    if compress and len(payload) > ZLIB_THRESHOLD and len(zlib.compress(
+            payload[:ZLIB_PROBE_SIZE], 1)) < ZLIB_PROBE_RATIO * ZLIB_PROBE_SIZE:
+        compressed = zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags += 'z'
+    return payload, flags
+
+
+def decode_payload(payload, flags=''):
+    """ The data encode_payload turned into payload"""
+    if 'z' in flags:
+        payload = zlib.decompress(payload)
+    data = pickle.loads(payload)
+    if 'c' in flags:
+        data = expand_results(data)
+    return data
 
 
 class Protocol(asynchat.async_chat):
     """ docstring placeholder"""
+    # read and write in bigger pieces than asynchat's 4K, chunked map
+    #   tasks and results are much larger than a single record
+    ac_in_buffer_size = 64 * 1024
+    ac_out_buffer_size = 64 * 1024
+
     def __init__(self, conn=None):
         if conn:
             asynchat.async_chat.__init__(self, conn)
@@ -56,6 +249,18 @@ class Protocol(asynchat.async_chat):
         self.buffer = []
         self.auth = None
         self.mid_command = False
+        self.mid_encoding = ''
+        # pickle protocol 0 and no encodings until the other end's
+        #   capabilities say more
+        self.pickle_protocol = 0
+        self.encodings = ''
+        # Unix domain socket connections may read shared memory segments,
+        #   and send large payloads through them if shared_memory is set
+        self.local = False
+        self.shared_memory = False
+        # segments sent from here, any the other end hasn't read when the
+        #   connection closes are removed then
+        self.segments = []
 
     def collect_incoming_data(self, data):
         """ docstring placeholder"""
@@ -66,8 +271,19 @@ class Protocol(asynchat.async_chat):
         if not ":" in command:
             command += ":"
         if data:
-            pdata = pickle.dumps(data)
+            pdata, encoding = encode_payload(data, self.pickle_protocol,
+                                             'c' in self.encodings,
+                                             'z' in self.encodings)
+            if self.shared_memory and 'm' in self.encodings and \
+                    len(pdata) > SHARED_MEMORY_THRESHOLD:
+                pdata = write_segment(pdata)
+                encoding += 'm'
+                self.segments = [name for name in self.segments
+                                 if os.path.exists(segment_path(name))]
+                self.segments.append(pdata)
             command += str(len(pdata))
+            if encoding:
+                command += ":" + encoding
             logging.debug("<- %s" % command)
             self.push(command + "\n" + pdata)
         else:
@@ -85,6 +301,7 @@ class Protocol(asynchat.async_chat):
             if command == "challenge":
                 self.process_command(command, length)
             elif length:
+                length, _, self.mid_encoding = length.partition(":")
                 self.set_terminator(int(length))
                 self.mid_command = command
             else:
@@ -93,24 +310,65 @@ class Protocol(asynchat.async_chat):
             if not self.auth == "Done":
                 logging.fatal("Recieved pickled data from unauthed source")
                 sys.exit(1)
-            data = pickle.loads(''.join(self.buffer))
+            payload = ''.join(self.buffer)
+            if 'm' in self.mid_encoding:
+                if not self.local:
+                    logging.fatal("Shared memory payload from a remote host")
+                    sys.exit(1)
+                try:
+                    payload = read_segment(payload)
+                except (IOError, OSError):
+                    # the sender closed the connection and removed it
+                    logging.warning("Segment %s is gone, dropping %s" %
+                                    (payload, self.mid_command))
+                    payload = None
             self.set_terminator("\n")
             command = self.mid_command
             self.mid_command = None
-            self.process_command(command, data)
+            if payload is not None:
+                self.process_command(command, decode_payload(
+                    payload, self.mid_encoding))
         self.buffer = []
 
+    def close(self):
+        """ Closes the connection and removes the segments sent on it that
+        were never read"""
+        for name in self.segments:
+            try:
+                os.remove(segment_path(name))
+            except OSError:
+                pass
+        self.segments = []
+        asynchat.async_chat.close(self)
+
     def send_challenge(self):
         """ docstring placeholder"""
         self.auth = os.urandom(20).encode("hex")
         self.send_command(":".join(["challenge", self.auth]))
 
     def respond_to_challenge(self, command, data):
-        """ docstring placeholder"""
+        """ Answers a challenge, then tells the other end, which has just
+        authenticated this one, what this end reads"""
         mac = hmac.new(self.password, data, hashlib.sha1)
         self.send_command(":".join(["auth", mac.digest().encode("hex")]))
+        self.send_capabilities()
         self.post_auth_init()
 
+    def send_capabilities(self):
+        """ Sends the highest pickle protocol and the encodings read here"""
+        encodings = ENCODINGS if self.local else ENCODINGS.replace('m', '')
+        self.send_command('capabilities', {'pickle_protocol': PICKLE_PROTOCOL,
+                                           'encodings': encodings})
+
+    def set_capabilities(self, command, data):
+        """ Sends with the lower of the two pickle protocols and the
+        encodings both ends read from here on"""
+        self.pickle_protocol = min(int(data.get('pickle_protocol', 0)),
+                                   PICKLE_PROTOCOL)
+        self.encodings = ''.join([flag for flag in data.get('encodings', '')
+                                  if flag in ENCODINGS and
+                                  (flag != 'm' or self.local)])
+
     def verify_auth(self, command, data):
         """ docstring placeholder"""
         mac = hmac.new(self.password, self.auth, hashlib.sha1)
@@ -124,6 +382,7 @@ class Protocol(asynchat.async_chat):
         """ docstring placeholder"""
         commands = {
             'challenge': self.respond_to_challenge,
+            'capabilities': self.set_capabilities,
             'disconnect': lambda x, y: self.handle_close(),
             }
 
@@ -154,13 +413,33 @@ class Client(Protocol):
         """ docstring placeholder"""
         Protocol.__init__(self)
         self.mapfn = self.reducefn = self.collectfn = None
+        # work done, for reporting throughput: map tasks and the
+        #   datasource items they mapped, reduce tasks and the keys they
+        #   reduced, and the seconds spent on each
+        self.maps_done = 0
+        self.map_items = 0
+        self.map_seconds = 0.0
+        self.reduces_done = 0
+        self.reduce_keys = 0
+        self.reduce_seconds = 0.0
 
     def conn(self, server, port):
         """ docstring placeholder"""
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        # commands are small writes, don't hold them back for acks
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.connect((server, port))
         asyncore.loop()
 
+    def conn_unix(self, path, shared_memory=False):
+        """ Connects to a server on the same host through its Unix domain
+        socket, shared_memory sends large results through segments"""
+        self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.local = True
+        self.shared_memory = shared_memory
+        self.connect(path)
+        asyncore.loop()
+
     def handle_connect(self):
         """ docstring placeholder"""
         pass
@@ -182,22 +461,37 @@ class Client(Protocol):
         self.reducefn = types.FunctionType(marshal.loads(reducefn), globals(), 'reducefn')
 
     def call_mapfn(self, command, data):
-        """ docstring placeholder"""
-        logging.info("Mapping %s" % str(data[0]))
+        """ Maps every (key, value) item of one chunk, data is
+        (task id, items)"""
+        logging.info("Mapping task %s, %d items" % (data[0], len(data[1])))
+        start = time.time()
         results = {}
-        for k, v in self.mapfn(data[0], data[1]):
-            if k not in results:
-                results[k] = []
-            results[k].append(v)
+        for key, value in data[1]:
+            for k, v in self.mapfn(key, value):
+                if k not in results:
+                    results[k] = []
+                results[k].append(v)
         if self.collectfn:
+            # map side combine, each key sends a single value
             for k in results:
                 results[k] = [self.collectfn(k, results[k])]
+        self.maps_done += 1
+        self.map_items += len(data[1])
+        self.map_seconds += time.time() - start
         self.send_command('mapdone', (data[0], results))
 
     def call_reducefn(self, command, data):
-        """ docstring placeholder"""
-        logging.info("Reducing %s" % str(data[0]))
-        results = self.reducefn(data[0], data[1])
+        """ Reduces every (key, values) item of one partition, data is
+        (partition, items)"""
+        logging.info("Reducing partition %s, %d keys" % (data[0],
+                                                         len(data[1])))
+        start = time.time()
+        results = {}
+        for key, values in data[1]:
+            results[key] = self.reducefn(key, values)
+        self.reduces_done += 1
+        self.reduce_keys += len(data[1])
+        self.reduce_seconds += time.time() - start
         self.send_command('reducedone', (data[0], results))
 
     def process_command(self, command, data=None):
@@ -228,29 +522,71 @@ class Server(asyncore.dispatcher, object):
         asyncore.dispatcher.__init__(self)
         self.mapfn = None
         self.reducefn = None
+        # combiner, takes a key and a list of values and returns one value
+        #   of the same kind, so its output can be combined again
         self.collectfn = None
+        # fold map results into one combined value per key as they come in,
+        #   needs collectfn
+        self.incremental = False
+        self.reduce_partitions = DEFAULT_REDUCE_PARTITIONS
+        # datasource items per map task, None sizes the chunks from the
+        #   measured task latency
+        self.chunk_size = None
+        self.window = DEFAULT_WINDOW
         self.datasource = None
         self.password = None
-
-    def run_server(self, password="", port=DEFAULT_PORT):
-        """ docstring placeholder"""
+        self.unix_path = None
+        # send large tasks to Unix socket clients through shared memory
+        self.shared_memory = False
+
+    def run_server(self, password="", port=DEFAULT_PORT, ready=None,
+                   unix_path=None):
+        """ Serves the job until it's done and returns the results
+
+        ready is called once the port accepts connections, so clients
+        started alongside know when to connect.  With unix_path the server
+        listens on that Unix domain socket instead of the port, for clients
+        on the same host
+        """
         self.password = password
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.bind(("", port))
-        self.listen(1)
+        self.unix_path = unix_path
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.bind(unix_path)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+            self.bind(("", port))
+        # several local clients connect at the same moment
+        self.listen(socket.SOMAXCONN)
+        if ready:
+            ready()
         try:
-            asyncore.loop()
+            # wake idle clients now and then, a stalled task may be worth
+            #   sending to one of them by now
+            while asyncore.socket_map:
+                asyncore.loop(timeout=SPECULATION_POLL_SECONDS, count=1)
+                self.taskmanager.wake_idle()
         except:
             self.close_all()
             raise
+        finally:
+            if unix_path and os.path.exists(unix_path):
+                os.remove(unix_path)
 
         return self.taskmanager.results
 
     def handle_accept(self):
         """ docstring placeholder"""
         conn, addr = self.accept()
+        if self.unix_path is None:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         sc = ServerChannel(conn, self)
         sc.password = self.password
+        sc.local = self.unix_path is not None
+        sc.shared_memory = sc.local and self.shared_memory
 
     def handle_close(self):
         """ docstring placeholder"""
@@ -274,34 +610,65 @@ class ServerChannel(Protocol):
         """ docstring placeholder"""
         Protocol.__init__(self, conn)
         self.server = server
+        # tasks sent to this client without a result back yet
+        self.in_flight = 0
+        # when the client sent its last result, queued tasks start then
+        self.last_done = 0
+        # (command, task id) of those tasks, given back if the client goes
+        self.tasks = set()
 
         self.start_auth()
 
     def handle_close(self):
         """ docstring placeholder"""
         logging.info("Client disconnected")
+        taskmanager = self.server.taskmanager
+        taskmanager.idle_channels.discard(self)
         self.close()
+        tasks, self.tasks = self.tasks, set()
+        for command, task_id in tasks:
+            taskmanager.release(command, task_id)
+        if tasks:
+            taskmanager.wake_idle()
 
     def start_auth(self):
         """ docstring placeholder"""
         self.send_challenge()
 
     def start_new_task(self):
-        """ docstring placeholder"""
-        command, data = self.server.taskmanager.next_task(self)
-        if command == None:
-            return
-        self.send_command(command, data)
+        """ Tops this client up to server.window outstanding tasks
+
+        Only a client with nothing outstanding is sent a duplicate of a
+        task another client is still working on
+        """
+        while self.in_flight < max(1, self.server.window):
+            command, data = self.server.taskmanager.next_task(
+                self, speculative=self.in_flight == 0)
+            if command == None:
+                return
+            self.send_command(command, data)
+            if command == 'disconnect':
+                return
+            self.in_flight += 1
+            self.tasks.add((command, data[0]))
 
     def map_done(self, command, data):
         """ docstring placeholder"""
-        self.server.taskmanager.map_done(data)
+        self.in_flight -= 1
+        self.tasks.discard(('map', data[0]))
+        self.server.taskmanager.map_done(data, self.last_done)
+        self.last_done = time.time()
         self.start_new_task()
+        self.server.taskmanager.wake_idle()
 
     def reduce_done(self, command, data):
         """ docstring placeholder"""
-        self.server.taskmanager.reduce_done(data)
+        self.in_flight -= 1
+        self.tasks.discard(('reduce', data[0]))
+        self.server.taskmanager.reduce_done(data, self.last_done)
+        self.last_done = time.time()
         self.start_new_task()
+        self.server.taskmanager.wake_idle()
 
     def process_command(self, command, data=None):
         """ docstring placeholder"""
@@ -337,62 +704,221 @@ class TaskManager:
         self.datasource = datasource
         self.server = server
         self.state = TaskManager.START
-
-    def next_task(self, channel):
-        """ docstring placeholder"""
+        self.adaptive_chunk_size = 1
+        # clients left without a task, woken when there may be one
+        self.idle_channels = set()
+        self.start_phase()
+
+    def start_phase(self):
+        """ Forgets the task timings of the previous phase"""
+        # first dispatch time and dispatch count of outstanding tasks
+        self.started = {}
+        self.attempts = {}
+        # tasks that may still be duplicated, by time of last dispatch
+        self.candidates = OrderedDict()
+        # tasks no client is running any more, sent before anything else
+        self.released = []
+        # sorted seconds per item of the finished tasks
+        self.latencies = []
+
+    def dispatch(self, task_id):
+        """ Records a task being sent to a client"""
+        now = time.time()
+        self.started.setdefault(task_id, now)
+        self.attempts[task_id] = self.attempts.get(task_id, 0) + 1
+        self.candidates.pop(task_id, None)
+        if self.attempts[task_id] < MAX_ATTEMPTS:
+            self.candidates[task_id] = now
+
+    def finish(self, task_id, items, last_done):
+        """ Records a task's first result, returns its seconds
+
+        last_done is when the same client finished its previous task, a task
+        queued behind that one only started then
+        """
+        seconds = time.time() - max(self.started.pop(task_id), last_done)
+        bisect.insort(self.latencies, seconds / max(1, items))
+        self.attempts.pop(task_id, None)
+        self.candidates.pop(task_id, None)
+        return seconds
+
+    def release(self, command, task_id):
+        """ Takes back a task from a client that went away without its
+        result, the task is handed out again if no other client has it"""
+        phase = {'map': TaskManager.MAPPING, 'reduce': TaskManager.REDUCING}
+        if phase.get(command) != self.state or task_id not in self.attempts:
+            return
+        self.attempts[task_id] -= 1
+        if self.attempts[task_id] > 0:
+            self.candidates.setdefault(task_id, self.started[task_id])
+        else:
+            del self.started[task_id]
+            self.candidates.pop(task_id, None)
+            self.released.append(task_id)
+
+    def speculate(self, command, working):
+        """ (command, task) re-sending the longest running task, if it has
+        run long enough to look stalled, else (None, None)
+
+        Nothing is sent again before a task of the phase has finished, there
+        is no telling how long tasks take until then
+        """
+        if not self.candidates or not self.latencies:
+            return (None, None)
+        task_id, dispatched = next(self.candidates.iteritems())
+        per_item = self.latencies[
+            int(SPECULATIVE_PERCENTILE * (len(self.latencies) - 1))]
+        threshold = max(MIN_SPECULATION_SECONDS,
+                        len(working[task_id]) * per_item)
+        if time.time() - dispatched < threshold:
+            return (None, None)
+        logging.info("Sending task %s again" % (task_id,))
+        self.dispatch(task_id)
+        return (command, (task_id, working[task_id]))
+
+    def wake_idle(self):
+        """ Offers a task to every idle client again"""
+        channels = list(self.idle_channels)
+        self.idle_channels.clear()
+        for channel in channels:
+            channel.start_new_task()
+
+    def chunk_size(self):
+        """ Datasource items for the next map task"""
+        if self.server.chunk_size:
+            return self.server.chunk_size
+        return self.adaptive_chunk_size
+
+    def adapt_chunk_size(self, items, seconds):
+        """ Sizes the next chunks so a task takes about TARGET_TASK_SECONDS
+
+        seconds is the dispatch to result time of a task of that many items,
+        the size at most doubles each time so one fast task can't make the
+        last chunks too big to share out
+        """
+        if seconds > 0:
+            wanted = int(TARGET_TASK_SECONDS * items / seconds)
+        else:
+            wanted = MAX_CHUNK_SIZE
+        self.adaptive_chunk_size = max(1, min(wanted,
+                                              2 * self.adaptive_chunk_size,
+                                              MAX_CHUNK_SIZE))
+
+    def next_task(self, channel, speculative=True):
+        """ Next (command, data) for a client, (None, None) if there is
+        nothing to hand out
+
+        Tasks of clients that went away come first.  Once every task has
+        been handed out, a speculative call re-sends the longest running
+        one if it looks stalled.  A client that gets nothing from a
+        speculative call is idle until wake_idle
+        """
+        if self.released:
+            task_id = self.released.pop(0)
+            self.dispatch(task_id)
+            if self.state == TaskManager.MAPPING:
+                return ('map', (task_id, self.working_maps[task_id]))
+            return ('reduce', (task_id, self.working_reduces[task_id]))
+        command, data = self.new_task()
+        if command is None and speculative:
+            if self.state == TaskManager.MAPPING:
+                command, data = self.speculate('map', self.working_maps)
+            elif self.state == TaskManager.REDUCING:
+                command, data = self.speculate('reduce',
+                                               self.working_reduces)
+            if command is None and channel is not None:
+                self.idle_channels.add(channel)
+        return (command, data)
+
+    def new_task(self):
+        """ (command, data) of the next task not yet handed out, or of the
+        disconnect once all are done.  (None, None) while the last tasks
+        of a phase are running"""
         if self.state == TaskManager.START:
             self.map_iter = iter(self.datasource)
+            self.map_tasks = 0
             self.working_maps = {}
             self.map_results = {}
             #self.waiting_for_maps = []
             self.state = TaskManager.MAPPING
         if self.state == TaskManager.MAPPING:
-            try:
-                map_key = self.map_iter.next()
-                map_item = map_key, self.datasource[map_key]
-                self.working_maps[map_item[0]] = map_item[1]
-                return ('map', map_item)
-            except StopIteration:
-                if len(self.working_maps) > 0:
-                    key = random.choice(self.working_maps.keys())
-                    return ('map', (key, self.working_maps[key]))
-                self.state = TaskManager.REDUCING
-                self.reduce_iter = self.map_results.iteritems()
-                self.working_reduces = {}
-                self.results = {}
+            items = [(map_key, self.datasource[map_key])
+                     for map_key in islice(self.map_iter, self.chunk_size())]
+            if items:
+                task_id = self.map_tasks
+                self.map_tasks += 1
+                self.working_maps[task_id] = items
+                self.dispatch(task_id)
+                return ('map', (task_id, items))
+            if len(self.working_maps) > 0:
+                return (None, None)
+            self.state = TaskManager.REDUCING
+            self.start_phase()
+            self.reduce_iter = iter(self.partition())
+            self.working_reduces = {}
+            self.results = {}
         if self.state == TaskManager.REDUCING:
             try:
                 reduce_item = self.reduce_iter.next()
                 self.working_reduces[reduce_item[0]] = reduce_item[1]
+                self.dispatch(reduce_item[0])
                 return ('reduce', reduce_item)
             except StopIteration:
                 if len(self.working_reduces) > 0:
-                    key = random.choice(self.working_reduces.keys())
-                    return ('reduce', (key, self.working_reduces[key]))
+                    return (None, None)
                 self.state = TaskManager.FINISHED
         if self.state == TaskManager.FINISHED:
             self.server.handle_close()
             return ('disconnect', None)
 
-    def map_done(self, data):
-        """ docstring placeholder"""
+    def partition(self):
+        """ (partition, [(key, values), ...]) of every non empty reduce
+        partition, the map results are handed over to them"""
+        partitions = [[] for _ in
+                      range(max(1, self.server.reduce_partitions))]
+        for key, values in self.map_results.iteritems():
+            partitions[hash(key) % len(partitions)].append((key, values))
+        self.map_results = {}
+        return [(number, items) for number, items in enumerate(partitions)
+                if items]
+
+    def map_done(self, data, last_done=0):
+        """ Collects the results of a map task, last_done as for finish"""
         # Don't use the results if they've already been counted
         if not data[0] in self.working_maps:
             return
 
-        for (key, values) in data[1].iteritems():
-            if key not in self.map_results:
-                self.map_results[key] = []
-            self.map_results[key].extend(values)
+        items = len(self.working_maps[data[0]])
+        self.adapt_chunk_size(items, self.finish(data[0], items, last_done))
+        if self.server.incremental and self.server.collectfn:
+            self.accumulate(data[1])
+        else:
+            for (key, values) in data[1].iteritems():
+                if key not in self.map_results:
+                    self.map_results[key] = []
+                self.map_results[key].extend(values)
         del self.working_maps[data[0]]
 
-    def reduce_done(self, data):
-        """ docstring placeholder"""
+    def accumulate(self, results):
+        """ Folds map results into the running value of each key, so only
+        one value per key is held until the reduce"""
+        collectfn = self.server.collectfn
+        for (key, values) in results.iteritems():
+            if key in self.map_results:
+                values = self.map_results[key] + values
+            if len(values) > 1:
+                values = [collectfn(key, values)]
+            self.map_results[key] = values
+
+    def reduce_done(self, data, last_done=0):
+        """ Collects the results of a reduce partition, last_done as for
+        finish"""
         # Don't use the results if they've already been counted
         if not data[0] in self.working_reduces:
             return
 
-        self.results[data[0]] = data[1]
+        self.finish(data[0], len(self.working_reduces[data[0]]), last_done)
+        self.results.update(data[1])
         del self.working_reduces[data[0]]
 
 def run_client():
@@ -400,6 +926,11 @@ def run_client():
     parser = optparse.OptionParser(usage="%prog [options]", version="%%prog %s"%VERSION)
     parser.add_option("-p", "--password", dest="password", default="", help="password")
     parser.add_option("-P", "--port", dest="port", type="int", default=DEFAULT_PORT, help="port")
+    parser.add_option("-u", "--unix", dest="unix_path", default=None,
+                      help="Unix domain socket of a server on this host")
+    parser.add_option("-m", "--shared-memory", dest="shared_memory",
+                      action="store_true",
+                      help="send large results through shared memory")
     parser.add_option("-v", "--verbose", dest="verbose", action="store_true")
     parser.add_option("-V", "--loud", dest="loud", action="store_true")
 
@@ -412,7 +943,10 @@ def run_client():
 
     client = Client()
     client.password = options.password
-    client.conn(args[0], options.port)
+    if options.unix_path:
+        client.conn_unix(options.unix_path, options.shared_memory)
+    else:
+        client.conn(args[0], options.port)
 
 
 if __name__ == '__main__':
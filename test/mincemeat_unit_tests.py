@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+
+"""
+CREDENTIALS
+  Module: mincemeat_unit_tests.py
+  Author: John Soper
+  Date: Oct 18, 2026
+  Rev: 1
+
+SUMMARY
+    Unit tests for the task handling, wire protocol and transports of the
+    mincemeat.py copy the local map-reduce runs use
+"""
+
+import unittest
+import multiprocessing
+import os.path
+import socket
+import tempfile
+import time
+
+import mincemeat
+
+
+class FakeMincemeatServer(object):
+    """ Just the mincemeat Server attributes a TaskManager reads"""
+
+    def __init__(self, chunk_size=None, collectfn=None, incremental=False):
+        self.chunk_size = chunk_size
+        self.collectfn = collectfn
+        self.incremental = incremental
+        self.reduce_partitions = mincemeat.DEFAULT_REDUCE_PARTITIONS
+        self.closed = False
+
+    def handle_close(self):
+        """ Records the end of the job"""
+        self.closed = True
+
+
+def count_parity(ready, stats, unix_path=None):
+    """ mincemeat client process of the launched job tests"""
+    ready.wait()
+    client = mincemeat.Client()
+    client.password = 'changeme'
+    if unix_path:
+        client.conn_unix(unix_path, shared_memory=True)
+    else:
+        client.conn('localhost', mincemeat.DEFAULT_PORT + 1)
+    stats.put((client.maps_done, client.map_items, client.reduce_keys))
+
+
+def parity_mapfn(_, value):
+    """ Map routine of test_launched_job"""
+    yield value % 2, 1
+
+
+def sum_reducefn(_, values):
+    """ Reduce routine of test_launched_job"""
+    return sum(values)
+
+
+class FakeClock(object):
+    """ Stands in for the time module in mincemeat, time only moves when a
+    test sets now"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        """ The fake time"""
+        return self.now
+
+
+class TestMincemeat(unittest.TestCase):
+    """ Tests of the mincemeat task handling the local runs use"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        mincemeat.time = self.clock
+
+    def tearDown(self):
+        mincemeat.time = time
+
+    def test_map_chunks(self):
+        """ Map tasks cover chunk_size datasource items each"""
+        datasource = dict((key, str(key)) for key in range(10))
+        server = FakeMincemeatServer(chunk_size=4)
+        manager = mincemeat.TaskManager(datasource, server)
+        tasks = [manager.next_task(None) for _ in range(3)]
+        self.assertEqual([command for command, _ in tasks], ['map'] * 3)
+        self.assertEqual([len(items) for _, (_, items) in tasks], [4, 4, 2])
+        self.assertEqual(sorted(item for _, (_, items) in tasks
+                                for item in items),
+                         sorted(datasource.items()))
+
+        for _, (task_id, items) in tasks:
+            manager.map_done((task_id, dict((key, [value])
+                                            for key, value in items)))
+        self.assertEqual(manager.next_task(None)[0], 'reduce')
+
+    def test_reduce_partitions(self):
+        """ Keys are reduced in hash partitions, one task each"""
+        server = FakeMincemeatServer(chunk_size=100)
+        server.reduce_partitions = 4
+        manager = mincemeat.TaskManager(dict.fromkeys(range(1)), server)
+        task_id = manager.next_task(None)[1][0]
+        manager.map_done((task_id, dict((key, [key, 1])
+                                        for key in range(892, 902))))
+        tasks = [manager.next_task(None) for _ in range(4)]
+        self.assertEqual([command for command, _ in tasks], ['reduce'] * 4)
+        for number, items in [data for _, data in tasks]:
+            self.assertEqual(set(hash(key) % 4 for key, _ in items),
+                             set([number]))
+
+        client = mincemeat.Client()
+        client.reducefn = lambda key, values: sum(values)
+        client.send_command = lambda command, data: manager.reduce_done(data)
+        for _, data in tasks:
+            client.call_reducefn('reduce', data)
+        self.assertEqual(manager.results, dict((key, key + 1)
+                                               for key in range(892, 902)))
+        self.assertEqual(manager.next_task(None), ('disconnect', None))
+        self.assertTrue(server.closed)
+
+    def test_adaptive_chunk_size(self):
+        """ Chunks grow by at most double towards the target task time"""
+        manager = mincemeat.TaskManager({}, FakeMincemeatServer())
+        self.assertEqual(manager.chunk_size(), 1)
+        manager.adapt_chunk_size(1, 0.0001)
+        self.assertEqual(manager.chunk_size(), 2)
+        manager.adapt_chunk_size(2, mincemeat.TARGET_TASK_SECONDS)
+        self.assertEqual(manager.chunk_size(), 2)
+        manager.adapt_chunk_size(2, 4 * mincemeat.TARGET_TASK_SECONDS)
+        self.assertEqual(manager.chunk_size(), 1)
+        manager.server.chunk_size = 50
+        self.assertEqual(manager.chunk_size(), 50)
+
+    def test_channel_window(self):
+        """ A client is kept window tasks ahead, duplicates only go to an
+        idle one"""
+        server = FakeMincemeatServer(chunk_size=2)
+        server.window = 2
+        server.taskmanager = mincemeat.TaskManager(
+            dict((key, key) for key in range(6)), server)
+        sockets = mincemeat.socket.socketpair()
+        channels = []
+        try:
+            for sock in sockets:
+                channel = mincemeat.ServerChannel(sock, server)
+                channel.sent = []
+                channel.send_command = lambda command, data, \
+                    sent=channel.sent: sent.append((command, data))
+                channels.append(channel)
+            first, second = channels
+            first.start_new_task()
+            self.assertEqual([data[0] for _, data in first.sent], [0, 1])
+            self.assertEqual(first.in_flight, 2)
+
+            # one task left, then nothing new for a busy client
+            second.start_new_task()
+            self.assertEqual([data[0] for _, data in second.sent], [2])
+            self.assertEqual(second.in_flight, 1)
+
+            first.map_done('mapdone', (0, {}))
+            self.assertEqual(len(first.sent), 2)
+            self.assertEqual(first.in_flight, 1)
+            self.clock.now += mincemeat.MIN_SPECULATION_SECONDS
+            second.map_done('mapdone', (2, {}))
+            self.assertEqual(second.sent[-1][0], 'map')
+            self.assertEqual(second.sent[-1][1][0], 1)
+        finally:
+            for channel in channels:
+                channel.close()
+
+    def test_launched_job(self):
+        """ A client started before the server connects once it's ready"""
+        mincemeat.time = time
+        server = mincemeat.Server()
+        server.datasource = dict((key, key) for key in range(100))
+        server.mapfn = parity_mapfn
+        server.reducefn = sum_reducefn
+        ready = multiprocessing.Event()
+        stats = multiprocessing.Queue()
+        client = multiprocessing.Process(target=count_parity,
+                                         args=(ready, stats))
+        client.start()
+        try:
+            results = server.run_server('changeme',
+                                        mincemeat.DEFAULT_PORT + 1, ready.set)
+        finally:
+            client.join(5)
+            if client.is_alive():
+                client.terminate()
+        self.assertEqual(results, {0: 50, 1: 50})
+        maps, items, keys = stats.get(timeout=1)
+        self.assertTrue(maps > 1)
+        self.assertEqual((items, keys), (100, 2))
+
+    def test_shared_memory_job(self):
+        """ A job over a Unix socket with every payload in shared memory"""
+        mincemeat.time = time
+        threshold = mincemeat.SHARED_MEMORY_THRESHOLD
+        default_segment_dir = mincemeat.SEGMENT_DIR
+        segment_dir = tempfile.mkdtemp()
+        mincemeat.SEGMENT_DIR = segment_dir
+        unix_path = os.path.join(segment_dir, 'mincemeat.sock')
+        try:
+            # set before the client forks, so both ends use segments
+            mincemeat.SHARED_MEMORY_THRESHOLD = 0
+            server = mincemeat.Server()
+            server.shared_memory = True
+            server.datasource = dict((key, key) for key in range(100))
+            server.mapfn = parity_mapfn
+            server.reducefn = sum_reducefn
+            ready = multiprocessing.Event()
+            stats = multiprocessing.Queue()
+            client = multiprocessing.Process(target=count_parity,
+                                             args=(ready, stats, unix_path))
+            client.start()
+            try:
+                results = server.run_server('changeme', ready=ready.set,
+                                            unix_path=unix_path)
+            finally:
+                client.join(5)
+                if client.is_alive():
+                    client.terminate()
+            self.assertEqual(results, {0: 50, 1: 50})
+            self.assertEqual(stats.get(timeout=1)[1:], (100, 2))
+            # every segment was read and removed, as was the socket
+            self.assertEqual(os.listdir(segment_dir), [])
+            self.assertRaises(ValueError, mincemeat.read_segment,
+                              '../mincemeat-x')
+        finally:
+            mincemeat.SHARED_MEMORY_THRESHOLD = threshold
+            mincemeat.SEGMENT_DIR = default_segment_dir
+            for path in os.listdir(segment_dir):
+                os.remove(os.path.join(segment_dir, path))
+            os.rmdir(segment_dir)
+
+    def test_segments_removed_on_close(self):
+        """ Segments the other end never read are removed when the sender's
+        connection closes, and a receiver drops a command whose segment is
+        gone"""
+        threshold = mincemeat.SHARED_MEMORY_THRESHOLD
+        default_segment_dir = mincemeat.SEGMENT_DIR
+        segment_dir = tempfile.mkdtemp()
+        mincemeat.SEGMENT_DIR = segment_dir
+        sender_socket, receiver_socket = socket.socketpair()
+        try:
+            mincemeat.SHARED_MEMORY_THRESHOLD = 0
+            sender = mincemeat.Protocol(sender_socket)
+            sender.shared_memory = True
+            sender.encodings = mincemeat.ENCODINGS
+            sent = []
+            sender.push = sent.append
+            receiver = mincemeat.Protocol(receiver_socket)
+            receiver.auth = "Done"
+            receiver.local = True
+            received = []
+            receiver.process_command = lambda *args: received.append(args)
+            for task_id in range(2):
+                sender.send_command('map', (task_id, ['x'] * 10))
+            self.assertEqual(len(os.listdir(segment_dir)), 2)
+
+            def deliver(message):
+                """ Feeds one sent command to the receiver"""
+                for part in message.split('\n', 1):
+                    receiver.collect_incoming_data(part)
+                    receiver.found_terminator()
+            deliver(sent[0])
+            self.assertEqual(received, [('map', (0, ['x'] * 10))])
+            self.assertEqual(len(os.listdir(segment_dir)), 1)
+            sender.close()
+            self.assertEqual(os.listdir(segment_dir), [])
+            deliver(sent[1])
+            self.assertEqual(len(received), 1)
+            self.assertEqual(receiver.get_terminator(), "\n")
+            receiver.close()
+        finally:
+            mincemeat.SHARED_MEMORY_THRESHOLD = threshold
+            mincemeat.SEGMENT_DIR = default_segment_dir
+            for path in os.listdir(segment_dir):
+                os.remove(os.path.join(segment_dir, path))
+            os.rmdir(segment_dir)
+
+    def test_speculative_execution(self):
+        """ Only a task running longer than most is sent again, and only
+        once"""
+        server = FakeMincemeatServer(chunk_size=1)
+        manager = mincemeat.TaskManager(dict.fromkeys(range(3)), server)
+        self.assertEqual(manager.next_task(None)[1][0], 0)
+        self.assertEqual(manager.next_task(None)[1][0], 1)
+        self.clock.now += 1
+        manager.map_done((0, {}))
+        self.clock.now += 0.5
+        self.assertEqual(manager.next_task(None)[1][0], 2)
+        self.clock.now += 0.5
+        manager.map_done((1, {}))
+
+        # task 2 has run 0.5s, finished ones took 1s and 2s
+        idle = object()
+        self.assertEqual(manager.next_task(idle), (None, None))
+        self.assertEqual(manager.idle_channels, set([idle]))
+        self.clock.now += 1
+        self.assertEqual(manager.next_task(None), ('map', (2, [(2, None)])))
+        self.clock.now += 60
+        self.assertEqual(manager.next_task(None), (None, None))
+
+        manager.map_done((2, {}))
+        self.assertEqual(manager.next_task(None)[0], 'disconnect')
+
+    def test_speculation_minimum(self):
+        """ Fast tasks aren't sent again before MIN_SPECULATION_SECONDS,
+        however long they take per item"""
+        server = FakeMincemeatServer(chunk_size=1)
+        manager = mincemeat.TaskManager(dict.fromkeys(range(2)), server)
+        self.assertEqual(manager.next_task(None)[1][0], 0)
+        self.assertEqual(manager.next_task(None)[1][0], 1)
+        self.clock.now += 0.001
+        manager.map_done((0, {}))
+        self.clock.now += mincemeat.MIN_SPECULATION_SECONDS / 2
+        self.assertEqual(manager.next_task(None), (None, None))
+        self.clock.now += mincemeat.MIN_SPECULATION_SECONDS / 2
+        self.assertEqual(manager.next_task(None), ('map', (1, [(1, None)])))
+
+    def test_no_speculation_before_first_result(self):
+        """ Nothing is sent twice until a task of the phase has finished"""
+        server = FakeMincemeatServer(chunk_size=1)
+        manager = mincemeat.TaskManager(dict.fromkeys(range(1)), server)
+        self.assertEqual(manager.next_task('a')[1][0], 0)
+        self.clock.now += 60
+        self.assertEqual(manager.next_task('b'), (None, None))
+        self.assertEqual(manager.attempts, {0: 1})
+        self.assertEqual(manager.idle_channels, set(['b']))
+
+    def test_lost_client_task_resent(self):
+        """ The tasks of a client that disconnects go to another one"""
+        server = FakeMincemeatServer(chunk_size=1)
+        server.window = 2
+        server.taskmanager = mincemeat.TaskManager(dict.fromkeys(range(2)),
+                                                   server)
+        sockets = mincemeat.socket.socketpair()
+        channels = []
+        try:
+            for sock in sockets:
+                channel = mincemeat.ServerChannel(sock, server)
+                channel.sent = []
+                channel.send_command = lambda command, data, \
+                    sent=channel.sent: sent.append((command, data))
+                channels.append(channel)
+            lost, other = channels
+            lost.start_new_task()
+            other.start_new_task()
+            self.assertEqual(other.sent, [])
+            lost.handle_close()
+            self.assertEqual([data[0] for _, data in other.sent], [0, 1])
+            self.assertEqual(server.taskmanager.attempts, {0: 1, 1: 1})
+            other.map_done('mapdone', (0, {}))
+            other.map_done('mapdone', (1, {}))
+            self.assertEqual(other.sent[-1][0], 'disconnect')
+        finally:
+            for channel in channels:
+                channel.close()
+
+    def test_incremental_combine(self):
+        """ Incremental mode keeps one combined value per key"""
+        for incremental, expected in [(False, {'a': [1, 2, 3], 'b': [4]}),
+                                      (True, {'a': [6], 'b': [4]})]:
+            server = FakeMincemeatServer(
+                chunk_size=1, incremental=incremental,
+                collectfn=lambda key, values: sum(values))
+            manager = mincemeat.TaskManager(dict.fromkeys(range(3)), server)
+            tasks = [manager.next_task(None)[1][0] for _ in range(3)]
+            manager.map_done((tasks[0], {'a': [1]}))
+            manager.map_done((tasks[1], {'a': [2], 'b': [4]}))
+            manager.map_done((tasks[2], {'a': [3]}))
+            self.assertEqual(manager.map_results, expected)
+
+    def test_payload_encodings(self):
+        """ Every payload encoding decodes to the data sent"""
+        results = (5, dict((key, [key % 2] * (key % 3))
+                           for key in range(890, 890 + 2 * 418)))
+        for data, flags in [(results, 'c'),
+                            ((5, {892: [0], 893: [1]}), ''),
+                            ((5, {'a': [1] * 40}), ''),
+                            ((5, dict((key, [1]) for key in range(40))), 'c'),
+                            ((6, [(0, (0, 71))]), ''),
+                            ('x' * (2 * mincemeat.ZLIB_THRESHOLD), 'z')]:
+            payload, encoding = mincemeat.encode_payload(data, 2)
+            self.assertEqual(encoding, flags)
+            self.assertEqual(mincemeat.decode_payload(payload, encoding),
+                             data)
+        self.assertTrue(len(mincemeat.encode_payload(results, 2)[0]) <
+                        len(mincemeat.encode_payload(results, 2, False)[0]))
+        self.assertEqual(mincemeat.pack_ints([300, -1]), ('h', '\x2c\x01'
+                                                            '\xff\xff'))
+
+    def test_capabilities_negotiated(self):
+        """ The challenge is unchanged, pickle protocol and encodings are
+        only used once both ends have named them"""
+        protocol = mincemeat.Protocol()
+        protocol.password = 'changeme'
+        protocol.post_auth_init = lambda: None
+        sent = []
+        protocol.push = sent.append
+        protocol.send_challenge()
+        self.assertEqual(sent[-1], 'challenge:%s\n' % protocol.auth)
+
+        results = (5, dict((key, [1]) for key in range(40)))
+        protocol.send_command('mapdone', results)
+        self.assertTrue(sent[-1].startswith('mapdone:%d\n' % len(
+            mincemeat.pickle.dumps(results, 0))))
+
+        del sent[:]
+        protocol.respond_to_challenge('challenge', 'abc')
+        self.assertEqual(sent[0], 'auth:%s\n' % mincemeat.hmac.new(
+            'changeme', 'abc', mincemeat.hashlib.sha1).hexdigest())
+        command, payload = sent[1].split('\n', 1)
+        self.assertEqual(mincemeat.pickle.loads(payload),
+                         {'pickle_protocol': mincemeat.PICKLE_PROTOCOL,
+                          'encodings': 'cz'})
+        self.assertEqual(command, 'capabilities:%d' % len(payload))
+
+        protocol.set_capabilities('capabilities',
+                                  {'pickle_protocol': 1, 'encodings': 'zm'})
+        self.assertEqual((protocol.pickle_protocol, protocol.encodings),
+                         (1, 'z'))
+        protocol.set_capabilities('capabilities',
+                                  {'pickle_protocol': 99, 'encodings': 'cz'})
+        self.assertEqual(protocol.pickle_protocol, mincemeat.PICKLE_PROTOCOL)
+        protocol.send_command('mapdone', results)
+        self.assertTrue(sent[-1].startswith('mapdone:%d:c\n' % len(
+            mincemeat.encode_payload(results, mincemeat.PICKLE_PROTOCOL)[0])))
+
+    def test_client_maps_chunk(self):
+        """ The client maps every item of a chunk into one reply"""
+        client = mincemeat.Client()
+        client.mapfn = lambda key, value: [(value % 2, key)]
+        sent = []
+        client.send_command = lambda command, data: sent.append(
+            (command, data))
+        client.call_mapfn('map', (7, [(1, 3), (2, 4), (3, 5)]))
+        self.assertEqual(sent, [('mapdone', (7, {0: [2], 1: [1, 3]}))])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
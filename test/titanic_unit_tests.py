@@ -12,17 +12,175 @@ SUMMARY
 """
 
 import unittest
+import hashlib
 import os.path
 import sys
-import difflib
+import tempfile
+import threading
+import time
 from cStringIO import StringIO
 
+try:
+    from moto import mock_s3_deprecated
+except ImportError:
+    # S3 tests need a local stand in for S3
+    mock_s3_deprecated = None
+
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_DIR)
 
 #  Eclipse will show a FAILURE below, but that is just an artifact
 #  Add a space, do Project>Clean, and save file to remove
 import src.emr_titanic as emr_titanic
+import src.local_titanic as local_titanic
+import src.merge_output as merge_output
+import src.s3_transfer as s3_transfer
+import src.job_watcher as job_watcher
+import src.shard_input as shard_input
+# emr_titanic has already put src/mapper on the path
+import survival_model # pylint: disable=F0401,C0411
+import mapper # pylint: disable=F0401,C0411
+import passenger_csv # pylint: disable=F0401,C0411
+import line_index # pylint: disable=F0401,C0411
+
+class FakeEmrConnection(object):
+    """ Stand in for a boto EMR connection on a fake clock
+
+    schedule is a list of (seconds, state), the job flow enters each state
+    that many seconds after the start.  sleep() only advances the clock
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.now = 0.0
+        self.calls = []
+
+    def clock(self):
+        """ Fake time.time"""
+        return self.now
+
+    def sleep(self, seconds):
+        """ Fake time.sleep"""
+        self.calls.append(('sleep', seconds))
+        self.now += seconds
+
+    def state(self):
+        """ The state the schedule gives for now"""
+        return [state for seconds, state in self.schedule
+                if seconds <= self.now][-1]
+
+    def describe_jobflow(self, jobid):
+        """ Job flow in the scheduled state"""
+        self.calls.append(('describe_jobflow', jobid))
+        return type('JobFlow', (object,), {'state': self.state()})
+
+    def terminate_jobflow(self, jobid):
+        """ Records the termination"""
+        self.calls.append(('terminate_jobflow', jobid))
+
+    def run_jobflow(self, name, **options):
+        """ Records the new job flow, ids are j-1, j-2..."""
+        self.calls.append(('run_jobflow', name, options.get('keep_alive')))
+        self.jobflow_options = options
+        return 'j-%d' % len([call for call in self.calls
+                             if call[0] == 'run_jobflow'])
+
+    def add_jobflow_steps(self, jobid, steps):
+        """ Records the steps, ids are s-1, s-2..."""
+        self.calls.append(('add_jobflow_steps', jobid, len(steps)))
+        step_count = len([call for call in self.calls
+                          if call[0] == 'add_jobflow_steps'])
+        step_id = type('StepId', (object,), {'value': 's-%d' % step_count})
+        return type('JobFlowStepList', (object,), {'stepids': [step_id]})
+
+    def describe_step(self, jobid, step_id):
+        """ Step in the scheduled state"""
+        self.calls.append(('describe_step', jobid, step_id))
+        status = type('StepStatus', (object,), {'state': self.state()})
+        return type('HadoopStep', (object,), {'status': status})
+
+
+class FakeKey(object):
+    """ Stand in for a boto S3 key, keeps its contents in memory"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.etag = None
+        self.size = 0
+
+    def set_contents_from_filename(self, path, policy=None):
+        """ Stores the file as this key"""
+        with open(path, 'rb') as upload_file:
+            self.bucket.store(self, upload_file.read())
+
+
+class FakeMultipartUpload(object):
+    """ Stand in for a boto multipart upload"""
+
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.parts = {}
+
+    def upload_part_from_file(self, part_file, part_number, size):
+        """ Keeps one part, with a pause so parts overlap"""
+        self.bucket.note_thread()
+        self.parts[part_number] = part_file.read(size)
+
+    def cancel_upload(self):
+        """ Drops the parts"""
+        self.parts = {}
+
+    def complete_upload(self):
+        """ Joins the parts, returns the key with its multipart ETag"""
+        numbers = sorted(self.parts)
+        data = ''.join(self.parts[number] for number in numbers)
+        digests = ''.join(hashlib.md5(self.parts[number]).digest()
+                          for number in numbers)
+        key = self.bucket.store(FakeKey(self.bucket, self.name), data)
+        key.etag = '"%s-%d"' % (hashlib.md5(digests).hexdigest(),
+                                len(numbers))
+        return key
+
+
+class FakeBucket(object):
+    """ Thread safe stand in for a boto S3 bucket, records the threads
+    that sent data to it"""
+
+    def __init__(self, name):
+        self.name = name
+        self.keys = {}
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def note_thread(self):
+        """ Records the calling thread, the pause lets others start"""
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+
+    def store(self, key, data):
+        """ Keeps data as the contents of key, returns the key"""
+        self.note_thread()
+        key.etag = '"%s"' % hashlib.md5(data).hexdigest()
+        key.size = len(data)
+        with self.lock:
+            self.keys[key.name] = key
+        return key
+
+    def new_key(self, name):
+        """ A key that is only stored once it has contents"""
+        return FakeKey(self, name)
+
+    def get_key(self, name):
+        """ The stored key, or None"""
+        return self.keys.get(name)
+
+    def initiate_multipart_upload(self, name, policy=None):
+        """ A new multipart upload of the key name"""
+        return FakeMultipartUpload(self, name)
+
 
 # pylint: disable=R0904
 class TestSequenceFunctions(unittest.TestCase):
@@ -32,6 +190,25 @@ class TestSequenceFunctions(unittest.TestCase):
     def setUp(self):
         self.seq = range(10)
         self.my_emr = emr_titanic.EmrProcessing()
+        # keep test uploads out of the real upload manifest
+        self.manifest_path = tempfile.mktemp(suffix='.json')
+        self.real_manifest = emr_titanic.UPLOAD_MANIFEST
+        emr_titanic.UPLOAD_MANIFEST = self.manifest_path
+        # moto's fake sockets mix up large concurrent request bodies,
+        #   so transfers through moto are sent one at a time
+        self.my_emr.transfer_threads = 1
+        self.jobflow_path = tempfile.mktemp(suffix='.json')
+        self.real_jobflow_file = emr_titanic.WARM_JOBFLOW_FILE
+        emr_titanic.WARM_JOBFLOW_FILE = self.jobflow_path
+
+    def tearDown(self):
+        emr_titanic.UPLOAD_MANIFEST = self.real_manifest
+        emr_titanic.WARM_JOBFLOW_FILE = self.real_jobflow_file
+        # columnar copy of test.csv made by the local runs
+        for path in (self.manifest_path, self.jobflow_path,
+                     "../data/test.cols"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_clear_local_out_directory(self):
         """ test if local output directory deletes"""
@@ -87,38 +264,119 @@ class TestSequenceFunctions(unittest.TestCase):
         identical_macs = captured_name1 == captured_name2
         self.assertTrue(identical_macs, "mac address not consistent")
 
-    def test_update_mapper_file(self):
-        """ est that one line in mapper file can be correctly altered"""
-        update_string = "[[1, 1, 1, 1], [1, 1, 1, 1], [1, 1, 1, 1]]"
-        self.check_mapper_update_file(update_string, "model1")
-        update_string = "[[0, 0, 1, 1], [0, 1, 1, 1], [1, 1, 0, 0]]"
-        self.check_mapper_update_file(update_string, "model2")
-
-    def check_mapper_update_file(self, update_string, model_name):
-        """ Helper function for previous mapper file settings"""
-        mapper_file = "../src/mapper/mapper.py"
-        if os.path.exists(mapper_file):
-            os.remove(mapper_file)
-        file_still_exists = False
-        if os.path.exists(mapper_file):
-            file_still_exists = True
-        self.assertFalse(file_still_exists, "mapper.py was not deleted")
-        self.my_emr.update_mapper_file(model_name)
-        new_file_exists = False
-        if os.path.exists(mapper_file):
-            new_file_exists = True
-        self.assertTrue(new_file_exists, "mapper.py was not created")
-
-        with open('../src/mapper/mapper_template.py', 'r') as file1:
-            with open(mapper_file, 'r') as file2:
-                diff = difflib.unified_diff(file1.readlines(),
-                                            file2.readlines())
-        delta = ''.join(x[2:] for x in diff if x.startswith('+ '))
-        target_string = "female_survival_table = " + update_string
-        strings_equal = delta.strip() == target_string
-        msg_string = model_name + " mapper.py line change incorrect"
-        self.assertTrue(strings_equal, msg_string)
+    def test_write_model_file(self):
+        """ Test that the selected model is written to the side file"""
+        model_file = "../src/mapper/model.json"
+        for model_name in ["model1", "model2"]:
+            if os.path.exists(model_file):
+                os.remove(model_file)
+            self.my_emr.write_model_file(model_name)
+            self.assertTrue(os.path.exists(model_file),
+                "model.json was not created")
+
+            models = survival_model.read_models(model_file)
+            registered = survival_model.load_registry()[model_name]
+            self.assertEqual(len(models), 1, "only one model expected")
+            self.assertEqual(models[0].to_dict(), registered.to_dict(),
+                model_name + " model.json contents incorrect")
+        os.remove(model_file)
 
+    def test_parse_user_selections(self):
+        """ Any registered model name is accepted on the command line"""
+        old_argv = sys.argv
+        try:
+            sys.argv = ["emr_titanic.py", "-s", "model2", "Virginia"]
+            self.my_emr.parse_user_selections()
+            self.assertEqual(self.my_emr.model_choice, "model2")
+            self.assertEqual(self.my_emr.region_name, "us-east-1")
+
+            sys.argv = ["emr_titanic.py", "no_such_model"]
+            self.my_emr.parse_user_selections()
+            self.assertEqual(self.my_emr.model_choice, "model1",
+                "unknown model names should fall back to the first model")
+
+            sys.argv = ["emr_titanic.py", "--sweep"]
+            self.my_emr.parse_user_selections()
+            self.assertEqual(self.my_emr.model_choices,
+                             survival_model.load_registry().keys())
+        finally:
+            sys.argv = old_argv
+
+    def test_score_needs_train_file(self):
+        """ --score without train.csv stops with a message, not a trace"""
+        old_argv, old_stdout = sys.argv, sys.stdout
+        train_file = emr_titanic.TRAIN_FILE
+        try:
+            emr_titanic.TRAIN_FILE = '../data/no_such_train.csv'
+            sys.argv = ["emr_titanic.py", "-s", "--score"]
+            sys.stdout = StringIO()
+            self.assertRaises(SystemExit, self.my_emr.parse_user_selections)
+            self.assertTrue('--score needs' in sys.stdout.getvalue())
+        finally:
+            sys.argv, sys.stdout = old_argv, old_stdout
+            emr_titanic.TRAIN_FILE = train_file
+
+    def test_compress_choices(self):
+        """ --compress none turns compression off, an unknown value stops
+        with a message before anything is uploaded"""
+        old_argv, old_stdout = sys.argv, sys.stdout
+        try:
+            sys.argv = ["emr_titanic.py", "-s", "--shards", "2",
+                        "--compress", "none"]
+            self.my_emr.parse_user_selections()
+            self.assertEqual(self.my_emr.compression, None)
+            sys.argv = ["emr_titanic.py", "-s", "--compress", "bz2"]
+            self.my_emr.parse_user_selections()
+            self.assertEqual(self.my_emr.compression, 'bz2')
+            for argv in (["--compress", "zip"], ["--compress"]):
+                sys.argv = ["emr_titanic.py", "-s"] + argv
+                sys.stdout = StringIO()
+                self.assertRaises(SystemExit,
+                                  self.my_emr.parse_user_selections)
+                self.assertTrue("--compress takes one of bz2, gz, none" in
+                                sys.stdout.getvalue())
+        finally:
+            sys.argv, sys.stdout = old_argv, old_stdout
+
+    def test_split_ranges(self):
+        """ Byte ranges cover the whole input and start on line starts"""
+        input_path = "../data/test.csv"
+        ranges = local_titanic.split_ranges(input_path, 4)
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(input_path))
+        with open(input_path, 'rb') as input_file:
+            contents = input_file.read()
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start, "ranges are not contiguous")
+            self.assertEqual(contents[start - 1], "\n",
+                "range does not start on a new line")
+
+    def test_local_processing(self):
+        """ Local run writes the same sorted part file as EMR"""
+        model_file = "../output/local_model.json"
+        part_file = "../output/local_part"
+        model = survival_model.load_registry()["model2"]
+        survival_model.write_models([model], model_file)
+        local_titanic.LocalProcessing(model_path=model_file,
+            output_path=part_file, processes=3, columns=False).run()
+
+        reader = passenger_csv.PassengerReader()
+        with open("../data/test.csv", 'r') as input_file:
+            expected = sorted(mapper.score_line(line, reader, [model.compiled()])
+                              for line in input_file)
+        with open(part_file, 'r') as output_file:
+            lines = output_file.readlines()
+        self.assertEqual(lines, ["%s\t\n" % line for line in expected])
+
+        if mapper.np is not None:
+            # the memory mapped columnar copy gives the same part file
+            local_titanic.LocalProcessing(model_path=model_file,
+                output_path=part_file, processes=3, columns=True).run()
+            with open(part_file, 'r') as output_file:
+                self.assertEqual(output_file.readlines(), lines)
+        os.remove(model_file)
+        os.remove(part_file)
 
     def test_post_process_output_file(self):
         """ Tests file refactoring into proper format"""
@@ -138,6 +396,450 @@ class TestSequenceFunctions(unittest.TestCase):
             correctly_processed = True
         self.assertTrue(correctly_processed, "output file processed wrong")
 
+    def test_model_sweep(self):
+        """ One pass over the input gives every model's Kaggle csv"""
+        self.my_emr.clear_local_output_directory()
+        model_names = survival_model.load_registry().keys()
+        self.my_emr.write_model_file(*model_names)
+        local_titanic.LocalProcessing(processes=2).run()
+        self.my_emr.post_process_output_file(model_names=model_names)
+
+        for model_name in model_names:
+            self.my_emr.write_model_file(model_name)
+            local_titanic.LocalProcessing(
+                output_path="../output/single_part", processes=2).run()
+            merge_output.merge_part_files(["../output/single_part"],
+                                          "../output/single.csv")
+            with open("../output/single.csv", 'r') as single_file:
+                expected = single_file.read()
+            with open("../output/titanic_test_data_%s.csv" % model_name,
+                      'r') as sweep_file:
+                self.assertEqual(sweep_file.read(), expected)
+        with open("../output/titanic_test_data.csv", 'r') as csv_file:
+            self.assertEqual(csv_file.readline().strip(),
+                             "PassengerId," + ",".join(model_names))
+
+    def test_local_scoring(self):
+        """ Scoring against labels gives counts and accuracy per model"""
+        self.my_emr.clear_local_output_directory()
+        model2 = survival_model.load_registry()["model2"].compiled()
+        # labelled like train.csv, every passenger as model2 predicts
+        reader = passenger_csv.PassengerReader(
+            passenger_csv.MODEL_FIELDS + ('Name',))
+        with open("../data/test.csv", 'r') as input_file:
+            rows = list(reader.read(input_file))
+        train_path = "../output/train.csv"
+        with open(train_path, 'w') as train_file:
+            train_file.write(passenger_csv.TRAIN_HEADER + "\n")
+            for passenger_id, pclass, sex, fare, name in rows:
+                train_file.write('%s,%d,%s,"%s",%s,,,,,%s,,\n' % (
+                    passenger_id, model2.predict(sex, pclass, fare), pclass,
+                    name.replace('"', '""'), sex, fare))
+
+        self.my_emr.write_model_file("model1", "model2")
+        local_titanic.LocalProcessing(input_path=train_path,
+                                      processes=3, score=True).run()
+        with open("../output/part-00000", 'r') as part_file:
+            lines = part_file.readlines()
+        self.assertEqual([line.split('\t')[0] for line in lines],
+                         ["model1", "model2"])
+
+        self.my_emr.post_process_scores()
+        with open("../output/titanic_scores.csv", 'r') as scores_file:
+            scores = [line.strip().split(',') for line in scores_file]
+        self.assertEqual(scores[0][:2], ["Model", "Accuracy"])
+        self.assertEqual(scores[2][:2], ["model2", "100.000"])
+        self.assertEqual(sum(int(count) for count in scores[1][2:]),
+                         len(rows))
+        self.assertTrue(float(scores[1][1]) < 100)
+
+    def test_write_shards(self):
+        """ Every shard has the header and together they hold the input"""
+        with open("../data/test.csv", 'r') as input_file:
+            lines = input_file.readlines()
+        shard_dir = tempfile.mkdtemp()
+        try:
+            for compression in ['gz', 'bz2']:
+                paths = shard_input.write_shards("../data/test.csv", shard_dir,
+                    shard_input.shard_size_for("../data/test.csv", 4),
+                    compression)
+                self.assertEqual(len(paths), 4)
+                self.assertTrue(paths[0].endswith("test-00000.csv." +
+                                                  compression))
+                rows = []
+                for path in paths:
+                    shard = shard_input.open_input(path)
+                    shard_lines = shard.readlines()
+                    shard.close()
+                    self.assertEqual(shard_lines[0], lines[0])
+                    rows.extend(shard_lines[1:])
+                self.assertEqual(rows, lines[1:])
+
+                # one mapper reading every shard outputs one header
+                reader = passenger_csv.PassengerReader()
+                models = [survival_model.load_registry()["model2"].compiled()]
+                output = []
+                for path in paths:
+                    shard = shard_input.open_input(path)
+                    output.extend(mapper.score_line(line, reader, models)
+                                  for line in shard)
+                    shard.close()
+                output = [line for line in output if line is not None]
+                reader = passenger_csv.PassengerReader()
+                self.assertEqual(output, [mapper.score_line(line, reader,
+                                                            models)
+                                          for line in lines])
+        finally:
+            for path in os.listdir(shard_dir):
+                os.remove(os.path.join(shard_dir, path))
+            os.rmdir(shard_dir)
+
+    def test_line_index(self):
+        """ Line spans read back every line, with or without NumPy"""
+        with open("../data/test.csv", 'rb') as input_file:
+            lines = input_file.readlines()
+        index = line_index.LineIndex("../data/test.csv")
+        try:
+            self.assertEqual(len(index), len(lines))
+            self.assertEqual([index.line(number) for number in index], lines)
+            self.assertEqual(line_index.read_span("../data/test.csv",
+                                                  index[1]), lines[1])
+            self.assertRaises(IndexError, index.__getitem__, len(lines))
+        finally:
+            index.close()
+
+        numpy = line_index.np
+        try:
+            for line_index.np in set([None, numpy]):
+                self.assertEqual(list(line_index.line_bounds('')), [0])
+                self.assertEqual(list(line_index.line_bounds('a\nbc')),
+                                 [0, 2, 4])
+                self.assertEqual(list(line_index.line_bounds('a\nbc\n')),
+                                 [0, 2, 5])
+        finally:
+            line_index.np = numpy
+
+    @unittest.skipIf(mock_s3_deprecated is None, "moto not installed")
+    def test_sharded_upload(self):
+        """ Shards replace the single input file in the bucket"""
+        with mock_s3_deprecated():
+            self.my_emr.empty_bucket()
+            self.my_emr.write_model_file("model2")
+            self.my_emr.create_and_fill_bucket()
+            bucket = emr_titanic.EmrProcessing.bucket
+            self.assertTrue(bucket.get_key('input/test.csv'))
+
+            self.my_emr.shards = 3
+            self.my_emr.compression = 'bz2'
+            self.my_emr.create_and_fill_bucket()
+            self.assertEqual([key.name for key in bucket.list('input/')],
+                             ['input/test-%05d.csv.bz2' % shard
+                              for shard in range(3)])
+
+    def test_merge_many_parts(self):
+        """ All parts are merged, sorted and unsorted, with tiny memory"""
+        self.my_emr.clear_local_output_directory()
+        with open("../output/part-00000", 'w') as part_file:
+            part_file.write("892,0\t\n900,1\t\n1000,0\t\n")
+        with open("../output/part-00001", 'w') as part_file:
+            part_file.write("1001,1\t\n893,1\t\nPassengerId,Survived\t\n"
+                            "999,0\t\n894,0\t\n")
+        with open("../output/part-00002", 'w') as part_file:
+            part_file.write("PassengerId,Survived\t\n")
+        self.my_emr.post_process_output_file(max_records=2)
+
+        with open("../output/titanic_test_data.csv", 'r') as csv_file:
+            lines = csv_file.readlines()
+        self.assertEqual(lines, ["PassengerId,Survived\n", "892,0\n",
+            "893,1\n", "894,0\n", "900,1\n", "999,0\n", "1000,0\n",
+            "1001,1\n"])
+
+    def test_merge_typedbytes_sweep(self):
+        """ Typed bytes parts have no header, a sweep's merge still names
+        every model's column"""
+        self.my_emr.clear_local_output_directory()
+        with open("../output/part-00000", 'w') as part_file:
+            part_file.write("893\t[1, 0]\n892\t[0, 0]\n")
+        self.my_emr.post_process_output_file(
+            model_names=["model1", "model2"])
+
+        with open("../output/titanic_test_data.csv", 'r') as csv_file:
+            self.assertEqual(csv_file.readlines(), [
+                "PassengerId,model1,model2\n", "892,0,0\n", "893,1,0\n"])
+        with open("../output/titanic_test_data_model2.csv", 'r') as csv_file:
+            self.assertEqual(csv_file.read(),
+                             "PassengerId,Survived\n892,0\n893,0\n")
+
+    def test_scan_part(self):
+        """ Sortedness is by PassengerId number, not by text"""
+        self.create_simple_file("../output/part-00000")
+        unparseable_data = []
+        self.assertFalse(merge_output.scan_part("../output/part-00000",
+                                                unparseable_data))
+        self.assertEqual(unparseable_data,
+                         ["created by automated software for testing"])
+
+    @unittest.skipIf(mock_s3_deprecated is None, "moto not installed")
+    def test_s3_round_trip(self):
+        """ Inputs go up and output parts come down through the fake S3"""
+        with mock_s3_deprecated():
+            self.my_emr.empty_bucket()
+            self.my_emr.write_model_file("model2")
+            self.my_emr.create_and_fill_bucket()
+            bucket = emr_titanic.EmrProcessing.bucket
+            key = bucket.get_key('input/test.csv')
+            self.assertEqual(s3_transfer.key_etag(key),
+                             s3_transfer.local_etag('../data/test.csv'))
+            self.assertTrue(bucket.get_key('mapper/survival_model.py'))
+            self.assertTrue(bucket.get_key('model/model.json'))
+
+            bucket.new_key('output/part-00000').set_contents_from_string(
+                "945,1\t\n")
+            bucket.new_key('output/part-00001').set_contents_from_string(
+                "1122,0\t\n")
+            self.my_emr.clear_local_output_directory()
+            self.my_emr.download_output_files()
+        self.assertEqual(sorted(os.listdir('../output')),
+                         ['part-00000', 'part-00001'])
+        with open('../output/part-00001', 'r') as part_file:
+            self.assertEqual(part_file.read(), "1122,0\t\n")
+
+    @unittest.skipIf(mock_s3_deprecated is None, "moto not installed")
+    def test_unchanged_uploads_skipped(self):
+        """ A second run only uploads what changed and keeps the inputs"""
+        with mock_s3_deprecated():
+            self.my_emr.empty_bucket()
+            self.my_emr.write_model_file("model2")
+            self.my_emr.create_and_fill_bucket()
+            bucket = emr_titanic.EmrProcessing.bucket
+            bucket.new_key('output/part-00000').set_contents_from_string(
+                "945,1\t\n")
+            bucket.new_key('jobflow_logs/j-1/steps').set_contents_from_string(
+                "log")
+
+            self.my_emr.empty_bucket()
+            self.assertTrue(bucket.get_key('input/test.csv'))
+            self.assertFalse(bucket.get_key('output/part-00000'))
+            # logs are only purged once they are LOG_MAX_AGE old
+            self.assertTrue(bucket.get_key('jobflow_logs/j-1/steps'))
+
+            self.my_emr.write_model_file("model1")
+            manifest = s3_transfer.UploadManifest(self.manifest_path)
+            transfer = s3_transfer.S3Transfer(bucket, threads=1,
+                                              manifest=manifest)
+            etags = transfer.upload_files([
+                ('../data/test.csv', 'input/test.csv'),
+                ('../src/mapper/model.json', 'model/model.json')])
+            # the skipped key's ETag comes from the manifest
+            self.assertEqual(etags['input/test.csv'],
+                             s3_transfer.local_etag('../data/test.csv'))
+            self.assertEqual(transfer.skipped,
+                             [('../data/test.csv', 'input/test.csv')])
+            self.assertEqual(s3_transfer.key_etag(
+                bucket.get_key('model/model.json')),
+                s3_transfer.local_etag('../src/mapper/model.json'))
+
+    @unittest.skipIf(mock_s3_deprecated is None, "moto not installed")
+    def test_multipart_upload(self):
+        """ Large files are sent in parts and get the multipart ETag"""
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as big_file:
+            big_file.write('x' * (6 * 1024 * 1024))
+        part_size = 5 * 1024 * 1024
+        try:
+            with mock_s3_deprecated():
+                bucket = emr_titanic.boto.connect_s3().create_bucket('parts')
+                transfer = s3_transfer.S3Transfer(bucket, threads=1,
+                    part_size=part_size, multipart_threshold=part_size)
+                etag = transfer.upload_file(path, 'big')
+                self.assertTrue(etag.endswith('-2'), "not a multipart ETag")
+                self.assertEqual(etag, s3_transfer.local_etag(path,
+                    part_size, part_size))
+                self.assertEqual(bucket.get_key('big').size,
+                                 os.path.getsize(path))
+        finally:
+            os.remove(path)
+
+    def test_concurrent_transfers(self):
+        """ Uploads and parts are sent from several threads at once"""
+        bucket = FakeBucket('threads')
+        paths = []
+        for size in (100, 200, 300, 5000):
+            handle, path = tempfile.mkstemp()
+            with os.fdopen(handle, 'wb') as upload_file:
+                upload_file.write(os.urandom(size))
+            paths.append(path)
+        uploads = [(path, 'key-%d' % number)
+                   for number, path in enumerate(paths)]
+        try:
+            manifest = s3_transfer.UploadManifest(self.manifest_path)
+            transfer = s3_transfer.S3Transfer(bucket, threads=4,
+                part_size=1024, multipart_threshold=1024, manifest=manifest)
+            etags = transfer.upload_files(uploads)
+            self.assertEqual(etags, dict((key_name, s3_transfer.local_etag(
+                path, 1024, 1024)) for path, key_name in uploads))
+            self.assertTrue(etags['key-3'].endswith('-5'))
+            self.assertTrue(len(bucket.threads) > 1, bucket.threads)
+
+            # nothing changed, nothing is sent, every ETag is still returned
+            bucket.threads.clear()
+            self.assertEqual(transfer.upload_files(uploads), etags)
+            self.assertEqual(transfer.skipped, uploads)
+            self.assertEqual(bucket.threads, set())
+        finally:
+            for path in paths:
+                os.remove(path)
+
+    def test_job_state_timings(self):
+        """ Every state change is reported with how long the state lasted"""
+        fake = FakeEmrConnection([(0, 'STARTING'), (300, 'RUNNING'),
+                                  (400, 'COMPLETED')])
+        self.my_emr.conn = fake
+        self.my_emr.jobid = 'j-1'
+        self.my_emr.verbose_mode = False
+        state, timings = self.my_emr.wait_until_job_completes(
+            clock=fake.clock, sleep=fake.sleep)
+        self.assertEqual(state, 'COMPLETED')
+        self.assertEqual([(timing.state, timing.next_state)
+                          for timing in timings],
+                         [('STARTING', 'RUNNING'), ('RUNNING', 'COMPLETED')])
+        self.assertTrue(300 <= timings[0].duration < 360)
+        # completion is seen soon after it happens
+        self.assertTrue(fake.now - 400 <= 30)
+        self.assertFalse(('terminate_jobflow', 'j-1') in fake.calls)
+
+    def test_job_polling_backoff(self):
+        """ Slow polls while starting, faster ones near expected completion"""
+        fake = FakeEmrConnection([(0, 'STARTING'), (600, 'RUNNING')])
+        policy = job_watcher.BackoffPolicy(expected_running=100)
+        watcher = job_watcher.JobWatcher(
+            lambda: fake.describe_jobflow('j-1').state, policy=policy,
+            timeout=750, clock=fake.clock, sleep=fake.sleep)
+        self.assertRaises(job_watcher.JobTimeout, watcher.watch)
+        waits = [call[1] for call in fake.calls if call[0] == 'sleep']
+        startup_polls = len([wait for wait in waits if wait >= 15])
+        # a fixed 10 second poll would describe the job flow 60 times
+        self.assertTrue(startup_polls < 20, waits)
+        self.assertEqual(policy.interval('RUNNING', 10, 0), 30)
+        self.assertEqual(policy.interval('RUNNING', 10, 90), 5)
+        # overdue, back off again instead of polling at the floor
+        self.assertEqual(policy.interval('RUNNING', 1, 200), 3)
+        self.assertEqual(policy.interval('RUNNING', 10, 200), 30)
+
+    def test_hung_job_terminated(self):
+        """ A job flow that never finishes is terminated at the timeout"""
+        fake = FakeEmrConnection([(0, 'STARTING')])
+        self.my_emr.conn = fake
+        self.my_emr.jobid = 'j-1'
+        self.my_emr.verbose_mode = False
+        old_stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            self.assertRaises(SystemExit,
+                              self.my_emr.wait_until_job_completes,
+                              timeout=900, clock=fake.clock, sleep=fake.sleep)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = old_stdout
+        self.assertEqual(fake.now, 900)
+        self.assertEqual(fake.calls[-1], ('terminate_jobflow', 'j-1'))
+        self.assertEqual(output, "\n** EMR job still STARTING after 900 "
+                         "seconds, it was terminated\n"
+                         "TIMED OUT  (STARTING took 900 seconds)\n")
+
+    def test_streaming_step_modes(self):
+        """ Predictions are map only unless total order is asked for"""
+        emr_titanic.EmrProcessing.bucket_name = 'titanic-test'
+        args = self.my_emr.streaming_step().args()
+        self.assertEqual(args[args.index('-jobconf') + 1],
+                         'mapred.reduce.tasks=0')
+        self.assertFalse('-reducer' in args)
+
+        self.my_emr.total_order = True
+        args = self.my_emr.streaming_step().args()
+        self.assertFalse('-jobconf' in args)
+        self.assertTrue('mapred.reduce.tasks=1' in args)
+        self.assertTrue('mapred.text.key.comparator.options=-k1,1n' in args)
+        # generic options have to come before the streaming ones
+        self.assertTrue(args.index('mapred.reduce.tasks=1') <
+                        args.index('-mapper'))
+
+        self.my_emr.score_mode = True
+        args = self.my_emr.streaming_step().args()
+        self.assertEqual(args[args.index('-reducer') + 1],
+                         's3n://titanic-test/mapper/reducer.py')
+        self.assertEqual(args[args.index('-combiner') + 1],
+                         's3n://titanic-test/mapper/reducer.py')
+        self.assertEqual(args[args.index('-input') + 1],
+                         's3n://titanic-test/train/')
+
+    def run_warm(self, fake):
+        """ One warm cluster run against the fake connection"""
+        self.my_emr.conn = fake
+        self.my_emr.region_name = 'us-west-2'
+        self.my_emr.verbose_mode = False
+        self.my_emr.warm_cluster = True
+        emr_titanic.EmrProcessing.bucket_name = 'titanic-test'
+        self.my_emr.setup_and_run_job()
+        return self.my_emr.wait_until_job_completes(clock=fake.clock,
+                                                    sleep=fake.sleep)
+
+    def test_warm_cluster_reused(self):
+        """ The second warm run adds a step instead of a new job flow"""
+        fake = FakeEmrConnection([(0, 'RUNNING'), (60, 'COMPLETED')])
+        state, _ = self.run_warm(fake)
+        self.assertEqual(state, 'COMPLETED')
+        self.assertEqual(fake.calls[0], ('run_jobflow', 'Titanic Warm', True))
+        self.assertEqual(fake.calls[1], ('add_jobflow_steps', 'j-1', 1))
+        idle_shutdown = fake.jobflow_options['bootstrap_actions'][0]
+        self.assertEqual(idle_shutdown.path,
+                         's3://titanic-test/bootstrap/idle_shutdown.sh')
+        self.assertEqual(idle_shutdown.args(),
+                         [str(emr_titanic.IDLE_TIMEOUT)])
+        self.assertTrue(('describe_step', 'j-1', 's-1') in fake.calls)
+        self.assertFalse(('describe_jobflow', 'j-1') in fake.calls)
+
+        # the job flow sits WAITING for the next run
+        fake = FakeEmrConnection([(0, 'WAITING')])
+        self.my_emr = emr_titanic.EmrProcessing()
+        fake.describe_step = lambda jobid, step_id: type('HadoopStep',
+            (object,), {'status': type('StepStatus', (object,),
+                                       {'state': 'COMPLETED'})})
+        self.run_warm(fake)
+        self.assertEqual(fake.calls, [('describe_jobflow', 'j-1'),
+                                      ('add_jobflow_steps', 'j-1', 1)])
+        self.assertEqual(self.my_emr.jobid, 'j-1')
+
+    def test_idle_warm_cluster_terminated(self):
+        """ A warm job flow about to shut itself down as idle is replaced"""
+        with open(self.jobflow_path, 'w') as jobflow_file:
+            jobflow_file.write('{"us-west-2": {"jobflow_id": "j-old", '
+                '"last_used": %f}}' % (emr_titanic.time.time() -
+                                       emr_titanic.IDLE_TIMEOUT + 60))
+        fake = FakeEmrConnection([(0, 'RUNNING'), (60, 'COMPLETED')])
+        self.run_warm(fake)
+        self.assertEqual(fake.calls[:2], [('terminate_jobflow', 'j-old'),
+            ('run_jobflow', 'Titanic Warm', True)])
+        self.assertEqual(self.my_emr.jobid, 'j-1')
+
+    def test_warm_clusters_per_region(self):
+        """ The warm job flow of another region is kept for its runs"""
+        with open(self.jobflow_path, 'w') as jobflow_file:
+            jobflow_file.write('{"us-east-1": {"jobflow_id": "j-east", '
+                '"last_used": %f}}' % emr_titanic.time.time())
+        fake = FakeEmrConnection([(0, 'RUNNING'), (60, 'COMPLETED')])
+        self.run_warm(fake)
+        self.assertEqual(fake.calls[0], ('run_jobflow', 'Titanic Warm', True))
+        jobflows = emr_titanic.EmrProcessing.load_warm_jobflows()
+        self.assertEqual(sorted(jobflows), ['us-east-1', 'us-west-2'])
+        self.assertEqual(jobflows['us-east-1']['jobflow_id'], 'j-east')
+
+        # a hung step only takes down its own region's job flow
+        self.my_emr.terminate_warm_jobflow('us-west-2')
+        self.assertEqual(fake.calls[-1], ('terminate_jobflow', 'j-1'))
+        self.assertEqual(emr_titanic.EmrProcessing.load_warm_jobflows().keys(),
+                         ['us-east-1'])
+
     @staticmethod
     def create_simple_file(file_name):
         """ Utility class to write small file"""